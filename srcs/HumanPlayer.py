@@ -4,6 +4,7 @@ from Simulator import Simulator
 from config import config
 import threading
 from s3 import S3
+from step_timers import StepTimers
 import signal
 import sys
 
@@ -12,6 +13,7 @@ import sys
 class HumanPlayer():
     def __init__(self, args):
         self.args = args
+        self.timers = StepTimers(config.name_human_player if self.args.timers else None)
         self.our_s3 = None
         if self.args.destination == "s3":
               self.our_s3 = S3()
@@ -33,21 +35,29 @@ class HumanPlayer():
         print("-------- PRESS any key to start connecting the keyboard, it can take a while...")
         state = self.env.reset()
         action = None
+        steps = 0
         get_key()
         print("\n\n**********         Now you can start driving with your KEYPADS :) :)         **********\n\n")
         while self.stop == 0:
             commands = self.commands
-            self.get_command()
+            with self.timers.time("get_command"):
+                self.get_command()
             if self.commands != commands:
                 action = [self.steering, self.throttle]
-                new_state, reward, done, info = self.env.step(action)
+                with self.timers.time("env.step"):
+                    new_state, reward, done, info = self.env.step(action)
             else:
-                new_state, reward, done, info = self.env.viewer.observe()
+                with self.timers.time("observe"):
+                    new_state, reward, done, info = self.env.viewer.observe()
             if threading.active_count() <= config.max_threads:
-                t = threading.Thread(target=append_db, args=[self.episode_memory, state, action, reward, new_state, done, info])
-                t.start()
+                # Only the thread start is paid by the loop
+                with self.timers.time("append_db"):
+                    t = threading.Thread(target=append_db, args=[self.episode_memory, state, action, reward, new_state, done, info])
+                    t.start()
             state = new_state
+            steps += 1
         print("stopping")
+        self.timers.dump(0, steps)
         save_memory_db(self.episode_memory, self.general_infos, 0, self.our_s3)
         
     
@@ -1,17 +1,30 @@
 import os
+import time
 import numpy as np
 from collections import deque
 from preprocessing import Preprocessing
-from agents.ddqn import DQNAgent
-from agents.sac import SoftActorCritic
+from agents.factory import create_agent, sim_action
 from utils import is_cte_out, read_pickle_file, init_dic_info, append_db, save_memory_db
 from Simulator import Simulator
-from gym.spaces import Box
 from config import config
 import os
 from encodDecod import AutoEncoder
 from PIL import Image
 from s3 import S3
+from frame_stack import create_frame_stack
+from encoder_cache import EncoderCache
+from inference import CompiledModel
+from vec_rollout import VectorizedRollout
+from pipeline import ActionPipeline
+from step_timers import StepTimers
+from train_scheduler import TrainScheduler
+from offline_trainer import OfflineTrainer
+from checkpoints import CheckpointManager
+from evaluator import Evaluator
+from sim_supervisor import SimCrashed
+from logs import get_logger, HOT
+
+logger = get_logger(__name__)
 # doesn't show TF warnings..
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
@@ -21,12 +34,17 @@ class NeuralPlayer():
 		run a DDQN training session, or test it's result, with the donkey simulator
 		'''
 		self.args = args
+		self.timers = StepTimers(config.name_neural_player if self.args.timers else None)
 		self.our_s3 = None
 		if self.args.save:
 			if self.args.destination == "s3":
 				self.our_s3 = S3()
 			self.general_infos = init_dic_info(self.args, self.our_s3)
-		if not self.args.no_sim:
+		# With actors, each actor process owns its simulator
+		# With several envs or an evaluation, simulators are owned by the VectorizedRollout or the Evaluator
+		self.vectorized = not self.args.no_sim and self.args.nb_envs > 1
+		self.has_sim = not self.args.no_sim and not self.args.actors and not self.vectorized and not self.args.eval
+		if self.has_sim:
 			Simulator(self)
 		# Construct gym environment. Starts the simulator if path is given.
 		self.memory = deque(maxlen=10000)
@@ -39,70 +57,174 @@ class NeuralPlayer():
 		# Create an instance of autoencoder, load model parametter 
 		# Call encoder and encode image
 		self.preprocessing = Preprocessing()
-		self.AC = AutoEncoder()
-		self.encoder, _, _ = self.AC.AutoEncoder_model(config.img_rows, config.img_cols)
-		self.enc_loaded = self.AC.Loaded_Encoder("", self.encoder)
+		self.frame_stack = create_frame_stack(self.args.latent)
+		self.load_encoder()
 
-		# Get size of state and action from environment
-		self.state_size = (config.img_rows, config.img_cols, config.img_channels)
-		self.action_space = Box(-1.0, 1.0, (2,), dtype=np.float32) ### TODO: not the best
-		# self.action_space = self.env.action_space  # Steering and Throttle
-		if args.agent == "DDQN": 
-			self.agent = DQNAgent(self.state_size,
-								self.action_space,
-								input_shape=(config.img_rows, config.img_cols, config.img_channels),
-								output_size=config.turn_bins,
-								train=not args.test)
-		elif args.agent == "SAC":
-			self.agent = SoftActorCritic(self.state_size,
-								self.action_space,
-								input_shape=(config.prep_img_rows, config.prep_img_cols, config.prep_img_channels),
-								learning_rate=1e-4,
-								train=not args.test)
+		self.agent = create_agent(args.agent, train=not args.test, latent=self.args.latent,
+									scale_frames=not self.args.unscaled_frames)
+		self.checkpoints = CheckpointManager(self.agent, self.model_path, self.model_name)
+		self.scheduler = None
+		if self.agent.train and self.args.train_every:
+			self.scheduler = TrainScheduler(self.agent,
+											self.memory,
+											self.args.train_every,
+											self.args.gradient_steps,
+											background=self.args.background_training)
+		self.pipeline = None
+		if self.args.pipeline:
+			self.pipeline = ActionPipeline(self.choose_sim_action)
 		# self.preprocessing = Preprocessing()
 
 		# For numpy print formating:
 		np.set_printoptions(precision=4)
 
-		if os.path.exists(args.model):
-			print("load the saved model")
-			# TODO: Carefull, when we will have 2 different agents available (DDQN & SAC),
-			# TODO: 	it will be an easy mistake to load the wrong one.
-			# TODO: 	We need to protect against it
-			self.agent.load_model(args.model)
+		self.load_model()
+		self.warm_up()
 		try:
-			self.run_agent()
+			if self.args.eval:
+				Evaluator(self, self.args.eval, self.args.nb_envs, self.args.ports).run()
+			elif self.args.actors:
+				# Imported here as actors are NeuralPlayers themselves
+				from actor_learner import ActorLearner
+				ActorLearner(self, self.args.actors).run()
+			elif self.args.no_sim and self.args.offline:
+				OfflineTrainer(self).run()
+			elif self.vectorized:
+				VectorizedRollout(self, self.args.nb_envs, self.args.ports).run()
+			else:
+				self.run_agent()
 		except KeyboardInterrupt:
-			print("stopping run...")
+			logger.info("stopping run...")
 		finally:
-			if self.args.sim == "simlaunch3000":
-				self.client.kill_sim()
-			if not self.args.no_sim:
+			if self.scheduler:
+				self.scheduler.close()
+			self.checkpoints.close()
+			if self.pipeline:
+				self.pipeline.close()
+			if self.has_sim:
+				if self.args.sim == "simlaunch3000":
+					self.client.kill_sim()
 				self.env.unwrapped.close()
 
-	def prepare_state(self, state, old_state=None): ### TODO: rename old state
-		# Preprocessing is done on image not numpy array	
-		state = Image.fromarray(state) # to check
-		x_t = np.array(self.preprocessing.process_image(state))
-		# x_t = self.preprocessing.process_image(state)
-		if type(old_state) == type(None):
-			# For 1st iteration when we do not have old_state
-			s_t = np.stack((x_t, x_t, x_t, x_t), axis=2)
-			# In Keras, need to reshape
-			# print(f"before:\t{s_t.shape = }")
-			# s_t = s_t.reshape(1, config.prep_img_rows, config.prep_img_cols)  # 1*80*80*4 wrong size ?
-			s_t = np.expand_dims(s_t, axis=0)
-			# print(f"after:\t{s_t.shape = }")
-
+	def load_model(self):
+		"""
+			Loads the weights of the agent from model_cache, where CheckpointManager writes them.
+			An evaluation without weights would score a random network: it raises instead.
+		"""
+		files = [file_name for _, file_name in self.agent.weights_files(self.model_path, self.model_name)]
+		missing = [file_name for file_name in files if not os.path.exists(file_name)]
+		if not missing:
+			logger.info("load the saved model %s", files)
+			# TODO: Carefull, when we will have 2 different agents available (DDQN & SAC),
+			# TODO: 	it will be an easy mistake to load the wrong one.
+			# TODO: 	We need to protect against it
+			self.agent.load_model(self.model_path, self.model_name)
+		elif self.args.eval:
+			raise FileNotFoundError(f"--eval needs the weights of --model {self.model_name}, missing: {missing}")
 		else:
-			# print(f"before:\t{x_t.shape = }")
-			# x_t = x_t.reshape(1, 1, config.encoder_output_shape)  # 1x80x80x1
-			x_t = np.expand_dims(x_t, axis=(0, 3))
-			# print(f"after:\t{x_t.shape = }")
+			logger.info("no saved model %s, the agent starts from new weights", missing)
+
+	def load_encoder(self):
+		self.AC = AutoEncoder()
+		self.encoder, _, _ = self.AC.AutoEncoder_model(config.img_rows, config.img_cols)
+		self.enc_loaded = self.AC.Loaded_Encoder("", self.encoder)
+		self.encoder_inference = CompiledModel(self.encoder)
+		self.encoder_cache = None
+		if self.args.latent and config.encoder_cache_bytes:
+			# Emptied when other weights are loaded by Loaded_Encoder
+			self.encoder_cache = EncoderCache(self.run_encoder, lambda: self.AC.encoder_checksum)
+
+	def encode_frames(self, frames):
+		"""
+			Encode preprocessed frames of shape (N, rows, cols) in one call of the encoder,
+			the frames already encoded are taken from the encoder cache
 
-			s_t = np.append(x_t, old_state[:, :, :, :3], axis=3)  # 1x80x80x4 
-			# print(f"{s_t.shape = }")
-		return s_t
+			Returns:
+				np.ndarray: latents of shape (N, config.encoder_output_shape)
+		"""
+		frames = np.asarray(frames, dtype=np.uint8)
+		if self.encoder_cache:
+			return self.encoder_cache.encode(frames)
+		return self.run_encoder(frames)
+
+	def run_encoder(self, frames):
+		# uint8 frames, the encoder normalizes them itself
+		return self.encoder_inference(frames[..., np.newaxis]).numpy()
+
+	def warm_up(self):
+		"""
+			Traces the compiled inference of the agent (and of the encoder with args.latent)
+			before the first step, so that the first actions are not slow
+		"""
+		elapsed = self.agent.warm_up()
+		if self.args.latent:
+			elapsed += self.encoder_inference.warm_up()
+		logger.info("inference warm-up: %.2fs", elapsed)
+
+	def prepare_state(self, state, new_episode=False, frame_stack=None):
+		"""
+			Preprocess the raw frame `state` and push it on `frame_stack`,
+			which defaults to the frame stack of this player.
+			With args.latent, the frame is encoded once and its latent is pushed instead.
+
+			Returns:
+				The stacked state, of shape (1, rows, cols, 4) or (1, config.encoder_output_shape, 4)
+				with args.latent, newest frame first.
+				It is a copy owned by the caller: it is stored in the replay memory
+				and reused as the current state of the next step.
+		"""
+		with self.timers.time("prepare_state"):
+			# Frames given to the encoder are cropped like its training frames
+			x_t = self.preprocessing.process_frame(state, crop=self.args.latent and config.encoder_crop)
+			if self.args.latent:
+				x_t = self.encode_frames(x_t[np.newaxis])[0]
+			frame_stack = frame_stack or self.frame_stack
+			if new_episode:
+				# For 1st iteration when we do not have old frames
+				frame_stack.reset(x_t)
+			else:
+				frame_stack.push(x_t)
+			return frame_stack.snapshot()
+
+	def choose_sim_action(self, preprocessed_state):
+		return sim_action(self.args.agent, self.agent, preprocessed_state, self.args.throttle)
+
+	def env_step(self, preprocessed_state, throttle, episode_len):
+		with self.timers.time("choose_action"):
+			if self.pipeline:
+				# Action chosen during the previous step, with its state
+				action = self.pipeline.next_action(preprocessed_state)
+			else:
+				action = sim_action(self.args.agent, self.agent, preprocessed_state, throttle)
+		new_state, reward, done, info = self.sim_step(action, episode_len)
+		return action, new_state, reward, done, info
+
+	def sim_step(self, action, episode_len, sim=None):
+		"""
+			Do `action` in the simulator of `sim`, anything with args and env.
+			Defaults to the simulator of this player.
+
+			With args.frame_skip k, `action` is repeated for k simulator steps,
+			or until the episode is over. Their rewards are summed and only the
+			last frame and info are returned.
+		"""
+		sim = sim or self
+		total_reward = 0
+		for i in range(sim.args.frame_skip):
+			# print(f"From env: cte {self.env.viewer.handler.cte}")
+			with self.timers.time("env.step"):
+				new_state, reward, done, info = sim.supervisor.step(action)
+			total_reward += reward
+			# After 10 simulator steps, whatever the frame skip, because sometimes
+			# 	simulator gives cte value from previous episode at the begining
+			# TODO: create function for defining game_over
+			if episode_len * sim.args.frame_skip + i > 10 and is_cte_out(info['cte']):
+				done = True
+			if done:
+				break
+		if done == True:
+			logger.debug("doonnnnnnnnnnnnne*************", extra=HOT)
+		return new_state, total_reward, done, info
 
 	def reward_optimization(self, reward, done):
 		if (done):
@@ -131,84 +253,87 @@ class NeuralPlayer():
 				#   info:                   info about velocity, cte ... etc
 		self.memory.append((preprocessed_state, action, reward, new_preprocessed_state, done, info))
 	
+	def recover_sim(self, crash):
+		"""
+			Restarts the simulator after `crash`, training goes on with the next episode
+		"""
+		if self.pipeline:
+			self.pipeline.reset()
+		self.supervisor.restart(crash)
+
 	def run_agent(self):
 		for e in range(config.EPISODES):
-			print("Episode: ", e)
-			episode_len = 0
-			# TODO: create function for following if/else
-			if self.args.no_sim != False:
-				res = self.get_db_from_file(self.args.no_sim, e)
-				if res == False:
-					break
-				state, _, _, _, done, _ = self.db[episode_len]
-			else:
-				done = False
-				state = self.env.reset()
-				throttle = self.args.throttle  # Set throttle as constant value
-			print(f"done = {done}")
-			preprocessed_state = None
-			while not done:
-				if self.args.sim == "simlaunch3000":
-					self.client.ping_sim()
-				# Apply preprocessing and stack 4 frames
-				preprocessed_state = self.prepare_state(state, old_state=preprocessed_state)
-				# print(f"From env: cte {self.env.viewer.handler.cte}")
-				# Choose action
-				# TODO: It is time to make the model decide the throttle itself
-				if not self.args.no_sim:
-					if self.args.agent == "SAC":
-						action = self.agent.choose_action(preprocessed_state)
-						steering, _ = action
-						# Adding throttle
-						# ATTENTION: change was needed for SAC agent
-						#		converted: 	[steering, throttle]
-						#		to:			np.array([steering, throttle])
-						action = np.array([steering, throttle])
-						print(f"Steering: {steering:10.3} | Throttle: {throttle:10.3}")
-					elif self.args.agent == "DDQN":
-						steering = self.agent.choose_action(preprocessed_state)
-						# Adding throttle
-						action = [steering, throttle]
-						# Do action
-					new_state, reward, done, info = self.env.step(action)
-					# episode_len > 10 because sometimes
-					# 	simulator gives cte value from previous episode at the begining
-					# TODO: create function for defining game_over
-					if episode_len > 10 and is_cte_out(info['cte']):
-						done = True
-					if done == True:
-						print("doonnnnnnnnnnnnne*************")
+			try:
+				logger.info("Episode: %s", e)
+				episode_len = 0
+				# TODO: create function for following if/else
+				if self.args.no_sim != False:
+					res = self.get_db_from_file(self.args.no_sim, e)
+					if res == False:
+						break
+					state, _, _, _, done, _ = self.db[episode_len]
 				else:
-					_, action, reward, new_state, done, info = self.db[episode_len]
-				# Reward opti
-				reward = self.reward_optimization(reward, done)
+					done = False
+					state = self.supervisor.reset()
+					throttle = self.args.throttle  # Set throttle as constant value
+				logger.debug("done = %s", done, extra=HOT)
 				# Apply preprocessing and stack 4 frames
-				new_preprocessed_state = self.prepare_state(new_state, old_state=preprocessed_state)
-				
-				self.save_memory_train(preprocessed_state, action, reward, new_preprocessed_state, done, info)
+				# 	Each frame is processed once: the new state of a step is the state of the next one
+				preprocessed_state = self.prepare_state(state, new_episode=True)
+				episode_start = time.time()
+				while not done:
+					# Choose action and do it
+					if not self.args.no_sim:
+						action, new_state, reward, done, info = self.env_step(preprocessed_state, throttle, episode_len)
+					else:
+						_, action, reward, new_state, done, info = self.db[episode_len]
+					# Reward opti
+					reward = self.reward_optimization(reward, done)
+					# Apply preprocessing and stack 4 frames
+					new_preprocessed_state = self.prepare_state(new_state)
 				
-				if self.args.save:
-					append_db(self.episode_memory, state, action, reward, new_state, done, info)
+					with self.timers.time("save_memory_train"):
+						self.save_memory_train(preprocessed_state, action, reward, new_preprocessed_state, done, info)
 				
-				# TODO: remove bc uncompatible with SAC
-				self.agent.update_epsilon()
-				# if self.agent.t % 30 == 0:
-				# print(f"Episode: {e}, episode_len: {episode_len:<5} Action: [{action[0]:6.3} {action[1]:6.3}], Reward: {reward:6.4} Ep_len: {episode_len:<5} MaxQ: {self.agent.max_Q:3.3}")
-				episode_len = episode_len + 1
-				if done or (self.db_len != 0 and episode_len == (self.db_len - 1)): ### TODO check longueur db
-					# Every episode update the target model to be same with model
-					self.agent.update_target_model()
-					# Save model for each episode
-					if self.agent.train:
-						self.agent.save_model(self.model_path, self.model_name)
-						# self.agent.save_model(f"{config.main_folder}/model_cache/{self.args.model}") ### TODO: faire un truc propre avec os
 					if self.args.save:
-						save_memory_db(self.episode_memory, self.general_infos, e, self.our_s3)
-					print(f"episode: {e} memory length: {len(self.memory)} epsilon: {self.agent.epsilon} episode length: {episode_len}")
+						with self.timers.time("append_db"):
+							append_db(self.episode_memory, state, action, reward, new_state, done, info)
+
+					if self.scheduler:
+						self.scheduler.step()
+				
+					# TODO: remove bc uncompatible with SAC
+					self.agent.update_epsilon()
+					# if self.agent.t % 30 == 0:
+					# print(f"Episode: {e}, episode_len: {episode_len:<5} Action: [{action[0]:6.3} {action[1]:6.3}], Reward: {reward:6.4} Ep_len: {episode_len:<5} MaxQ: {self.agent.max_Q:3.3}")
+					episode_len = episode_len + 1
+					if done or (self.db_len != 0 and episode_len == (self.db_len - 1)): ### TODO check longueur db
+						if self.pipeline:
+							self.pipeline.reset()
+						# Every episode update the target model to be same with model
+						self.agent.update_target_model()
+						# Save model for each episode
+						if self.agent.train:
+							self.checkpoints.maybe_save(e)
+							# self.agent.save_model(f"{config.main_folder}/model_cache/{self.args.model}") ### TODO: faire un truc propre avec os
+						if self.args.save:
+							save_memory_db(self.episode_memory, self.general_infos, e, self.our_s3)
+						logger.info("episode: %s memory length: %s epsilon: %s episode length: %s", e, len(self.memory), self.agent.epsilon, episode_len)
+						if not self.args.no_sim:
+							logger.info("control frequency: %8.2f Hz", episode_len / (time.time() - episode_start))
+						if self.scheduler:
+							logger.info("gradient steps: %s dropped: %s", self.scheduler.updates, self.scheduler.dropped)
+						if self.encoder_cache:
+							logger.info("encoder cache: %s", self.encoder_cache.stats())
+						self.timers.dump(e, episode_len)
 				
-				# Updating state variables
-				state = new_state
-				preprocessed_state = new_preprocessed_state
+					# Updating state variables
+					state = new_state
+					preprocessed_state = new_preprocessed_state
 
-			if self.agent.train:
-				self.agent.train_on_memory(self.memory)
+				# Without scheduler, the agent is trained once by episode
+				if self.agent.train and not self.scheduler:
+					self.agent.train_on_memory(self.memory)
+			except SimCrashed as crash:
+				# The transitions of the crashed episode already in memory are kept
+				self.recover_sim(crash)
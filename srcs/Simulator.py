@@ -34,11 +34,20 @@ import gym
 import uuid
 import gym_donkeycar ## Keep this module 
 from utils import save_memory_db
+from config import config
+from logs import get_logger
+from sim_supervisor import SimSupervisor
 import sys
 from tensorflow.compat.v1.keras import backend as K
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
+logger = get_logger(__name__)
+
+
+def heartbeat_failed(client, failures):
+	logger.warning("simlaunch3000 did not answer the ping of sim %s, %s times in a row", client.sim_port, failures)
+
 
 class Simulator:
 	def __init__(self, player):
@@ -46,42 +55,18 @@ class Simulator:
 		# only needed if TF==1.13.1
 		player.sim_config = tf.compat.v1.ConfigProto(log_device_placement=True)
 		player.sim_config.gpu_options.allow_growth = True
-		print(player.sim_config)
+		logger.debug("tf session config: %s", player.sim_config)
 
 		# Keras session init
 		player.sess = tf.compat.v1.Session(config=player.sim_config)
 		K.set_session(player.sess)
 
-
-		if player.args.sim == "simlaunch3000":
-			exe_path = "manual"
-			player.client = Client()
-			player.client.request_simulator()
-			player.args.port = player.client.sim_port
-			player.args.port = 9093
-		else:
-			exe_path = player.args.sim
-		# Create env
-		player.conf = {"exe_path": exe_path,
-						"host": "127.0.0.1",
-						"port": player.args.port,
-						"body_style": "donkey",
-						"body_rgb": (128, 128, 128),
-						"car_name": "me",
-						"font_size": 100,
-						"racer_name": "DDQN",
-						"country": "FR",
-						"bio": "Learning to drive w DDQN RL",
-						"guid": str(uuid.uuid4()),
-						"max_cte": 10,
-				}
-		print(player.conf)
-		player.env = gym.make(
-				player.args.env_name, conf=player.conf)
+		start_env(player)
+		player.supervisor = SimSupervisor(player)
 		# Signal handler
 		# not working on windows...
 		def signal_handler(signal, frame):
-				print("catching ctrl+c")
+				logger.info("catching ctrl+c")
 				if player.args.save or player.args.supervised:
 					save_memory_db(player.episode_memory, player.general_infos, "last")
 				player.env.unwrapped.close()
@@ -89,3 +74,36 @@ class Simulator:
 		signal.signal(signal.SIGINT, signal_handler)
 		signal.signal(signal.SIGTERM, signal_handler)
 		signal.signal(signal.SIGABRT, signal_handler)
+
+
+def start_env(player):
+	'''
+		Gets a simulator, from simlaunch3000 or by launching args.sim, and creates player.env on it
+	'''
+	if player.args.sim == "simlaunch3000":
+		exe_path = "manual"
+		player.client = Client()
+		player.client.request_simulator()
+		player.args.port = player.client.sim_port
+		# The sim is kept alive from a thread, not by the driving loop,
+		# every sim_config.heartbeat_interval: a tenth of the timeout of simlaunch3000
+		player.client.start_heartbeat(on_failure=[heartbeat_failed])
+	else:
+		exe_path = player.args.sim
+	# Create env
+	player.conf = {"exe_path": exe_path,
+					"host": "127.0.0.1",
+					"port": player.args.port,
+					"body_style": "donkey",
+					"body_rgb": (128, 128, 128),
+					"car_name": "me",
+					"font_size": 100,
+					"racer_name": "DDQN",
+					"country": "FR",
+					"bio": "Learning to drive w DDQN RL",
+					"guid": str(uuid.uuid4()),
+					"max_cte": 10,
+			}
+	logger.info("simulator conf: %s", player.conf)
+	player.env = gym.make(
+			player.args.env_name, conf=player.conf)
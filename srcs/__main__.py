@@ -1,6 +1,8 @@
 import argparse
 from HumanPlayer import HumanPlayer
 from NeuralPlayer import NeuralPlayer
+from config import config
+from logs import setup_logging
 
 
 def parse_arguments():
@@ -18,7 +20,7 @@ def parse_arguments():
 	parser.add_argument('--sim', type=str, default="manual",
 						help='path to unity simulator. maybe be left at manual if you would like to start the sim on your own.')
 	parser.add_argument('--model', type=str,
-						default="rl_driver", help='path to model')
+						default="rl_driver", help='name of the model in model_cache, loaded when its weights exist and saved there while training')
 	parser.add_argument('--test', action="store_true",
 						help='agent uses learned model to navigate env')
 	parser.add_argument('--port', type=int, default=9091,
@@ -37,11 +39,46 @@ def parse_arguments():
 						help='Choice of destination to save the memory', choices=["local", "s3"])
 	parser.add_argument('--supervised', action="store_true",
 						help='Use Human Player instead of Neural Player')
+	parser.add_argument('--actors', type=int, default=0,
+						help='Number of actor processes feeding a separate learner, 0 to train in the driving loop. Without simlaunch3000, actor i uses port + i')
+	parser.add_argument('--nb_envs', type=int, default=1,
+						help='Number of simulators driven at once with batched action selection')
+	parser.add_argument('--ports', type=lambda ports: [int(p) for p in ports.split(",")], default=None,
+						help='Comma separated ports of the simulators driven at once, sets --nb_envs. Defaults to port, port + 1, ...')
+	parser.add_argument('--pipeline', action="store_true",
+						help='Choose the next action while the simulator runs the current one (actions are one step late)')
+	parser.add_argument('--timers', action="store_true",
+						help='Time each stage of the driving loop, percentiles are dumped every episode in local_memory')
+	parser.add_argument('--train_every', type=int, default=config.train_every,
+						help='Train the agent every K env steps instead of once by episode, 0 to train once by episode')
+	parser.add_argument('--gradient_steps', type=int, default=config.gradient_steps,
+						help='Number of gradient steps every --train_every env steps')
+	parser.add_argument('--background_training', action="store_true",
+						help='Do the --train_every trainings on a thread, the driving loop never waits for them')
+	parser.add_argument('--offline', action="store_true",
+						help='With --no_sim, preprocess all the stored episodes once (with --latent, latents of latent_extraction.py are used when they exist) and train on shuffled minibatches for config.offline_epochs epochs')
+	parser.add_argument('--eval', type=int, default=0,
+						help='Evaluate the deterministic policy of --model on N episodes spread over --nb_envs (or --ports) simulators, metrics are saved in local_memory')
+	parser.add_argument('--frame_skip', type=int, default=config.frame_skip,
+						help='Repeat each chosen action for K simulator steps and sum their rewards, only the last frame is used')
+	parser.add_argument('--latent', action="store_true",
+						help='Encode each frame once with the AutoEncoder encoder, agents get stacks of latents (config.latent_shape)')
+	parser.add_argument('--unscaled_frames', action="store_true",
+						help='Agent networks get frames in [0, 255] instead of [0, 1]: needed by the agent checkpoints trained before the frames were scaled in the models')
+	parser.add_argument('--log_level', type=str, default=config.log_level, choices=["DEBUG", "INFO", "WARNING"],
+						help='DEBUG shows the per-step messages, at most once by config.log_interval seconds each')
 	args = parser.parse_args()
+	if args.frame_skip < 1:
+		parser.error("--frame_skip must be at least 1")
+	if args.ports:
+		args.nb_envs = len(args.ports)
+	if args.eval:
+		args.test = True
 	return (args)
 
 if __name__ == "__main__":
 	args = parse_arguments()
+	setup_logging(args.log_level)
 
 	if args.supervised:
 		human = HumanPlayer(args)
@@ -0,0 +1,200 @@
+import time
+import queue
+import multiprocessing as mp
+from config import config
+from NeuralPlayer import NeuralPlayer
+from preprocessing import Preprocessing
+from frame_stack import create_frame_stack
+from agents.factory import create_agent
+from Simulator import Simulator
+from pipeline import ActionPipeline
+from step_timers import StepTimers
+from sim_supervisor import SimCrashed
+from logs import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+
+class Actor(NeuralPlayer):
+	def __init__(self, actor_id, args, transitions, weights, stop_event):
+		'''
+			Drives its own simulator with the last weights published by the learner,
+			and sends every transition to the learner instead of training itself.
+		'''
+		self.actor_id = actor_id
+		self.args = args
+		self.timers = StepTimers(f"{config.name_neural_player}_actor{actor_id}" if self.args.timers else None)
+		self.transitions = transitions
+		self.weights = weights
+		self.stop_event = stop_event
+		# Episodes are not recorded by actors
+		self.args.save = False
+		self.episode_memory = []
+		if self.args.sim != "simlaunch3000":
+			# Each actor needs its own simulator
+			self.args.port = self.args.port + actor_id
+		Simulator(self)
+		self.preprocessing = Preprocessing()
+		self.frame_stack = create_frame_stack(self.args.latent)
+		if self.args.latent:
+			self.load_encoder()
+		self.agent = create_agent(args.agent, train=not args.test, latent=self.args.latent,
+									scale_frames=not self.args.unscaled_frames)
+		self.warm_up()
+		self.pipeline = None
+		if self.args.pipeline:
+			self.pipeline = ActionPipeline(self.choose_sim_action)
+		self.dropped = 0
+
+	def save_memory_train(self, preprocessed_state, action, reward, new_preprocessed_state, done, info):
+		try:
+			self.transitions.put_nowait((self.actor_id, (preprocessed_state, action, reward, new_preprocessed_state, done, info)))
+		except queue.Full:
+			# Never wait for the learner: the sim does not
+			self.dropped += 1
+
+	def refresh_weights(self):
+		try:
+			self.agent.set_policy_weights(self.weights.get_nowait())
+		except queue.Empty:
+			pass
+
+	def run(self):
+		e = 0
+		try:
+			while not self.stop_event.is_set():
+				episode_len = 0
+				done = False
+				try:
+					state = self.supervisor.reset()
+					preprocessed_state = self.prepare_state(state, new_episode=True)
+					while not done and not self.stop_event.is_set():
+						self.refresh_weights()
+						action, new_state, reward, done, info = self.env_step(preprocessed_state, self.args.throttle, episode_len)
+						reward = self.reward_optimization(reward, done)
+						new_preprocessed_state = self.prepare_state(new_state)
+						self.save_memory_train(preprocessed_state, action, reward, new_preprocessed_state, done, info)
+						self.agent.update_epsilon()
+						episode_len = episode_len + 1
+						preprocessed_state = new_preprocessed_state
+				except SimCrashed as crash:
+					# Only this actor's simulator is restarted, the learner is not affected
+					self.recover_sim(crash)
+				if self.pipeline:
+					self.pipeline.reset()
+				self.timers.dump(e, episode_len)
+				logger.info("actor: %s episode: %s epsilon: %s episode length: %s dropped transitions: %s", self.actor_id, e, self.agent.epsilon, episode_len, self.dropped)
+				e += 1
+		except KeyboardInterrupt:
+			pass
+		finally:
+			# Do not wait for the learner to read our last transitions before exiting
+			self.transitions.cancel_join_thread()
+			if self.args.sim == "simlaunch3000":
+				self.client.kill_sim()
+			self.env.unwrapped.close()
+
+
+def actor_main(actor_id, args, transitions, weights, stop_event):
+	# Spawned processes do not inherit the logging configuration
+	setup_logging(args.log_level)
+	Actor(actor_id, args, transitions, weights, stop_event).run()
+
+
+class ActorLearner():
+	def __init__(self, player, nb_actors, publish_every=config.learner_publish_every):
+		'''
+			Trains player.agent continuously on the transitions sent by `nb_actors` Actor processes,
+			so the simulators never wait for the gradient updates.
+
+			Args:
+				player (NeuralPlayer): owns the agent and the replay memory
+				nb_actors (int): number of actor processes, each one with its simulator
+				publish_every (int, optional): number of updates between two weights publications.
+					Defaults to config.learner_publish_every.
+		'''
+		self.player = player
+		self.agent = player.agent
+		self.publish_every = publish_every
+		# TF does not survive a fork: actors are started from a fresh interpreter
+		ctx = mp.get_context("spawn")
+		self.transitions = ctx.Queue(maxsize=config.actor_queue_size)
+		self.weights = [ctx.Queue(maxsize=1) for _ in range(nb_actors)]
+		self.stop_event = ctx.Event()
+		self.actors = [ctx.Process(target=actor_main,
+								args=(i, player.args, self.transitions, self.weights[i], self.stop_event),
+								daemon=True)
+						for i in range(nb_actors)]
+		self.steps = 0
+		self.updates = 0
+		self.episodes = 0
+		self.episode_lens = [0] * nb_actors
+
+	def publish_weights(self):
+		weights = self.agent.get_policy_weights()
+		for q in self.weights:
+			# Only the newest weights matter
+			try:
+				q.get_nowait()
+			except queue.Empty:
+				pass
+			try:
+				q.put_nowait(weights)
+			except queue.Full:
+				pass
+
+	def store(self, actor_id, transition):
+		self.player.save_memory_train(*transition)
+		self.steps += 1
+		self.episode_lens[actor_id] += 1
+		done = transition[4]
+		if done:
+			# Every episode update the target model to be same with model
+			self.agent.update_target_model()
+			if self.agent.train:
+				self.player.checkpoints.maybe_save(self.episodes)
+			# epsilon decays in the actors, they log it
+			logger.info("episode: %s actor: %s memory length: %s episode length: %s", self.episodes, actor_id, len(self.player.memory), self.episode_lens[actor_id])
+			self.episode_lens[actor_id] = 0
+			self.episodes += 1
+
+	def collect(self, timeout=None):
+		'''
+			Moves the waiting transitions to the replay memory.
+			Waits `timeout` seconds for the first one if given.
+		'''
+		try:
+			if timeout:
+				self.store(*self.transitions.get(timeout=timeout))
+			while True:
+				self.store(*self.transitions.get_nowait())
+		except queue.Empty:
+			pass
+
+	def run(self):
+		for actor in self.actors:
+			actor.start()
+		self.publish_weights()
+		start = time.time()
+		try:
+			while self.episodes < config.EPISODES:
+				self.collect()
+				# One counted update is one gradient step, whatever the agent
+				if self.agent.train and self.agent.train_step(self.player.memory):
+					self.updates += 1
+					if self.updates % self.publish_every == 0:
+						self.publish_weights()
+						elapsed = time.time() - start
+						logger.info("env steps/s: %8.2f | updates/s: %8.2f", self.steps / elapsed, self.updates / elapsed)
+				else:
+					# Nothing to learn from yet
+					self.collect(timeout=config.learner_wait_time)
+		finally:
+			self.stop()
+
+	def stop(self):
+		self.stop_event.set()
+		for actor in self.actors:
+			actor.join(timeout=config.actor_join_timeout)
+			if actor.is_alive():
+				actor.terminate()
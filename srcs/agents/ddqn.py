@@ -13,14 +13,21 @@ from tensorflow.compat.v1.keras import backend as K
 from collections import deque
 import numpy as np
 import random
-from utils import linear_unbin, linear_bin
+from utils import linear_unbin, linear_bin, h5_file_name
+from logs import get_logger, HOT
+from normalization import ScaleFrames
+from inference import CompiledModel
+
+logger = get_logger(__name__)
 
 # K.tensorflow_backend._get_available_gpus()
 
 
 class DQNAgent:
-	def __init__(self, state_size, action_space, input_shape, output_size, train=True):
+	def __init__(self, state_size, action_space, input_shape, output_size, train=True, scale_frames=True):
 		self.max_Q = 0.0
+		# False for the models trained on frames in [0, 255]
+		self.scale_frames = scale_frames
 		self.train = train
 		# Get size of state and action
 		self.state_size = state_size
@@ -45,6 +52,8 @@ class DQNAgent:
 		self.memory = deque(maxlen=10000)
 		# Create main model and target model
 		self.model = self.build_model()
+		# Actions are chosen one frame at a time: predict is too slow for it
+		self.inference = CompiledModel(self.model)
 		self.target_model = self.build_model()
 		self.target_model.summary()
 		# Copy the model to target model
@@ -53,7 +62,12 @@ class DQNAgent:
 
 	def build_model(self):
 		model = Sequential()
-		model.add(Input(shape=(64, 64, 4)))
+		if len(self.input_shape) == 3:
+			# uint8 frames, scaled in the model
+			model.add(Input(shape=self.input_shape, dtype=tf.uint8))
+			model.add(ScaleFrames(self.scale_frames))
+		else:
+			model.add(Input(shape=self.input_shape))
 		model.add(Flatten())
 		# (4, 128) -> comment les parser ?
 		# On a besoin de se retrouver avec une dimension a la fin
@@ -87,15 +101,34 @@ class DQNAgent:
 
 	def choose_action(self, s_t):
 		if np.random.rand() <= self.epsilon:
-			print("\tRandom choice !")
+			logger.debug("\tRandom choice !", extra=HOT)
 			return self.action_space.sample()[0]
 		else:
 			#print("Return Max Q Prediction")
-			q_values = self.model.predict(s_t)
+			q_values = self.inference(s_t).numpy()
 			# Convert q array to steering value
-			print(f"\tModel 'True' prediction: {q_values.shape}")
+			logger.debug("\tModel 'True' prediction: %s", q_values.shape, extra=HOT)
 			return linear_unbin(q_values[0])
 
+	def choose_actions(self, s_t, deterministic=False):
+		'''
+			Batched choose_action: one prediction for all the states of s_t
+			With deterministic, the best action is always chosen (no epsilon exploration)
+
+			Returns:
+				np.ndarray: one steering value per state
+		'''
+		explore = np.random.rand(len(s_t)) <= self.epsilon
+		if deterministic:
+			explore[:] = False
+		steerings = np.empty(len(s_t))
+		if not explore.all():
+			q_values = self.inference(s_t).numpy()
+			steerings[:] = [linear_unbin(q) for q in q_values]
+		for i in np.flatnonzero(explore):
+			steerings[i] = self.action_space.sample()[0]
+		return steerings
+
 	# def replay_memory(self, state, action, reward, next_state, done):
 	# 	self.memory.append((state, action, reward, next_state, done))
 
@@ -103,18 +136,35 @@ class DQNAgent:
 		if self.epsilon > self.epsilon_min:
 			self.epsilon -= (self.initial_epsilon - self.epsilon_min) / self.explore
 
+	def warm_up(self):
+		return self.inference.warm_up()
+
 	def load_model(self, path, name):
-		self.model.load_weights(path + name)
+		# The files written by save_model
+		for model, file_name in self.weights_files(path, name):
+			model.load_weights(file_name)
 	# Save the model which is under training
 
 	def save_model(self, path, name):
-		self.model.save_weights(path + name)
+		for model, file_name in self.weights_files(path, name):
+			model.save_weights(file_name)
+
+	def weights_files(self, path, name):
+		# Models to save, with their file
+		return [(self.model, h5_file_name(path + name))]
+
+	def get_policy_weights(self):
+		# Weights needed to choose actions, published by the learner to its actors
+		return self.model.get_weights()
+
+	def set_policy_weights(self, weights):
+		self.model.set_weights(weights)
 
 	def train_on_memory(self, memory):
 		# print(f"Memory len: {len(memory)}")
 		if len(memory) < self.train_start:
-			return
-		print(f"Train replay on {len(memory)} elements")
+			return False
+		logger.debug("Train replay on %s elements", len(memory), extra=HOT)
 		# print(f"agent Batch size: {self.batch_size}")
 		batch_size = min(self.batch_size, len(memory))
 		# print(f"Batch size: {batch_size}")
@@ -123,6 +173,14 @@ class DQNAgent:
 		state_t, action_t, reward_t, state_t1, done, info = zip(*minibatch) ### TODO: add info
 		state_t = np.concatenate(state_t) ### TODO: et dans le preprocessing?
 		state_t1 = np.concatenate(state_t1)
+		self.train_on_batch(state_t, action_t, reward_t, state_t1, done)
+		return True
+
+	def train_on_batch(self, state_t, action_t, reward_t, state_t1, done):
+		"""
+			One gradient step on a batch of transitions, given as arrays (or sequences) of same length
+		"""
+		batch_size = len(state_t)
 		# Targets, are the predictions from agent.
 		# Currently (april 20) they are 7 categories corresponding to values of steering
 		# The agent predicts Q-Values for each of these categories
@@ -145,4 +203,8 @@ class DQNAgent:
 				targets[i][bin_action] = reward_t[i] + \
 					self.discount_factor * (target_val_update[i][a])
 		# Now that all the targets have been updated, we can retrain the agent
-		self.model.train_on_batch(state_t, targets)
\ No newline at end of file
+		self.model.train_on_batch(state_t, targets)
+
+	def train_step(self, memory):
+		# A single gradient step, on one batch
+		return self.train_on_memory(memory)
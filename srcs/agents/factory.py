@@ -0,0 +1,79 @@
+import numpy as np
+from gym.spaces import Box
+from config import config
+from agents.ddqn import DQNAgent
+from agents.sac import SoftActorCritic
+from logs import get_logger, HOT
+
+logger = get_logger(__name__)
+
+
+def create_agent(agent_name, train=True, latent=False, scale_frames=True):
+	"""
+		Build the agent used by every driving loop (NeuralPlayer, actors, ...)
+
+		Args:
+			agent_name (str): "DDQN" or "SAC", as given by args.agent
+			train (bool, optional): False when only testing the agent. Defaults to True.
+			latent (bool, optional): states are stacks of encoded frames,
+				of shape config.latent_shape, as given by args.latent. Defaults to False.
+			scale_frames (bool, optional): frames are scaled in [0, 1] by the networks.
+				False for the checkpoints trained on frames in [0, 255], as given by args.unscaled_frames.
+				Defaults to True.
+
+		Returns:
+			The agent instance
+	"""
+	# Get size of state and action from environment
+	state_size = (config.img_rows, config.img_cols, config.img_channels)
+	if latent:
+		state_size = config.latent_shape
+	action_space = Box(-1.0, 1.0, (2,), dtype=np.float32) ### TODO: not the best
+	if agent_name == "DDQN":
+		return DQNAgent(state_size,
+						action_space,
+						input_shape=state_size,
+						output_size=config.turn_bins,
+						train=train,
+						scale_frames=scale_frames)
+	elif agent_name == "SAC":
+		return SoftActorCritic(state_size,
+						action_space,
+						input_shape=config.latent_shape if latent else (config.prep_img_rows, config.prep_img_cols, config.prep_img_channels),
+						learning_rate=1e-4,
+						train=train,
+						scale_frames=scale_frames)
+	raise ValueError(f"Unknown agent: {agent_name}")
+
+
+def sim_action(agent_name, agent, preprocessed_state, throttle):
+	"""
+		Ask the agent for the steering and returns the [steering, throttle] sent to the simulator
+	"""
+	# TODO: It is time to make the model decide the throttle itself
+	if agent_name == "SAC":
+		steering, _ = agent.choose_action(preprocessed_state)
+		# Adding throttle
+		# ATTENTION: change was needed for SAC agent
+		#		converted: 	[steering, throttle]
+		#		to:			np.array([steering, throttle])
+		logger.debug("Steering: %10.3g | Throttle: %10.3g", steering, throttle, extra=HOT)
+		return np.array([steering, throttle])
+	steering = agent.choose_action(preprocessed_state)
+	# Adding throttle
+	return [steering, throttle]
+
+
+def sim_actions(agent_name, agent, preprocessed_states, throttle, deterministic=False):
+	"""
+		Batched sim_action: a single prediction for the states of every simulator
+		With deterministic, the agent does not explore
+
+		Returns:
+			A list with the [steering, throttle] of each simulator
+	"""
+	if agent_name == "SAC":
+		steerings, _ = agent.choose_action(preprocessed_states, deterministic=deterministic)
+	else:
+		steerings = agent.choose_actions(preprocessed_states, deterministic=deterministic)
+	return [np.array([steering, throttle]) for steering in np.reshape(steerings, -1)]
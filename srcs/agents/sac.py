@@ -17,28 +17,35 @@ import numpy as np
 import random
 from copy import deepcopy
 from agents.sac_policy import GaussianPolicy
+from logs import get_logger, HOT
+from normalization import frames_input
+from utils import h5_file_name
 
-def build_model_ValueNetwork(input_shape, output_size, learning_rate):
+logger = get_logger(__name__)
+
+def build_model_ValueNetwork(input_shape, output_size, learning_rate, scale_frames=True):
 	"""
 	This model will be an approximator of the Value Function to estimate the Expected Return of an episode from a state
 	"""
 	model = Sequential()
-	state_input = layers.Input(shape=input_shape[0])
-	current_layer = layers.Conv2D(24, (5, 5), 
-								strides=(2, 2), padding="same", 
-								activation=activations.relu)(state_input)
-	current_layer = layers.Conv2D(32, (5, 5), 
-								strides=(2, 2), padding="same", 
-								activation=activations.relu)(current_layer)
-	current_layer = layers.Conv2D(64, (5, 5), 
-								strides=(2, 2), padding="same", 
-								activation=activations.relu)(current_layer)
-	current_layer = layers.Conv2D(64, (3, 3), 
-								strides=(2, 2), padding="same",
-								activation=activations.relu)(current_layer)
-	current_layer = layers.Conv2D(64, (3, 3), 
-								strides=(1, 1), padding="same", 
-								activation=activations.relu)(current_layer)
+	state_input, current_layer = frames_input(input_shape[0], scale_frames)
+	# Stacks of latents (config.latent_shape) are already features: no convolutions
+	if len(input_shape[0]) == 3:
+		current_layer = layers.Conv2D(24, (5, 5), 
+									strides=(2, 2), padding="same", 
+									activation=activations.relu)(current_layer)
+		current_layer = layers.Conv2D(32, (5, 5), 
+									strides=(2, 2), padding="same", 
+									activation=activations.relu)(current_layer)
+		current_layer = layers.Conv2D(64, (5, 5), 
+									strides=(2, 2), padding="same", 
+									activation=activations.relu)(current_layer)
+		current_layer = layers.Conv2D(64, (3, 3), 
+									strides=(2, 2), padding="same",
+									activation=activations.relu)(current_layer)
+		current_layer = layers.Conv2D(64, (3, 3), 
+									strides=(1, 1), padding="same", 
+									activation=activations.relu)(current_layer)
 	current_layer = layers.Flatten()(current_layer)
 	current_layer = layers.Dense(512)(current_layer)
 	state_end = layers.Activation('relu')(current_layer)
@@ -98,8 +105,9 @@ class SoftActorCritic():
 					action_space=(2,),
 					input_shape=(64, 64, 3),
 					learning_rate=1e-4,
-					train=True):
-		print("Initialization of SAC")
+					train=True,
+					scale_frames=True):
+		logger.info("Initialization of SAC")
 		# Useless now, but needs to be compatible with DDQN
 		self.state_size = state_size
 		self.action_space = action_space
@@ -112,7 +120,7 @@ class SoftActorCritic():
 		# Policy
 		self.input_shape_policy = input_shape
 		self.learning_rate = learning_rate
-		self.policy = GaussianPolicy(input_shape=input_shape, learning_rate=learning_rate)
+		self.policy = GaussianPolicy(input_shape=input_shape, learning_rate=learning_rate, scale_frames=scale_frames)
 
 		# Q functions estimators:
 		self.lr_qfunc = 1e-3
@@ -120,27 +128,27 @@ class SoftActorCritic():
 		self.input_shape_phi_action = (2,)
 
 		phi_input = (self.input_shape_phi_state, self.input_shape_phi_action)
-		print(f"Input shape of ValueNet is: {phi_input}")
+		logger.info("Input shape of ValueNet is: %s", phi_input)
 		# self.output_size_throttle = 1
 		# self.output_size_steering = (1,)
 		self.output_size = (1, 1)
-		print(f"Output shape of 1tput_size {self.output_size}")
+		logger.info("Output shape of 1tput_size %s", self.output_size)
 
-		self.phi_1 = build_model_ValueNetwork(phi_input, self.output_size, learning_rate)
-		self.phi_2 = build_model_ValueNetwork(phi_input, self.output_size, learning_rate)
+		self.phi_1 = build_model_ValueNetwork(phi_input, self.output_size, learning_rate, scale_frames)
+		self.phi_2 = build_model_ValueNetwork(phi_input, self.output_size, learning_rate, scale_frames)
 		self.phi_1.summary()
 		self.discount_factor = 0.9
 
 	def update_epsilon(self):
 		pass
 
-	def choose_action(self, s_t, concat=False):
-		a_t_throttle, a_t_steering = self.policy.choose_action(s_t)
+	def choose_action(self, s_t, concat=False, deterministic=False):
+		a_t_throttle, a_t_steering = self.policy.choose_action(s_t, deterministic=deterministic)
 		a_t_throttle = np.squeeze(a_t_throttle)
 		a_t_steering = np.squeeze(a_t_steering)
 		# TODO: Make sure action are conscripted in 
-		print(f"a_t_throttle: {a_t_throttle.shape} => {a_t_throttle}")
-		print(f"a_t_steering: {a_t_steering.shape} => {a_t_steering}")
+		logger.debug("a_t_throttle: %s => %s", a_t_throttle.shape, a_t_throttle, extra=HOT)
+		logger.debug("a_t_steering: %s => %s", a_t_steering.shape, a_t_steering, extra=HOT)
 		# a_t_throttle = float(a_t_throttle)
 		# a_t_steering = float(a_t_steering)
 		if concat:
@@ -150,8 +158,8 @@ class SoftActorCritic():
 
 	def qfunc_predict(self, s_t1, a_t1, which=0):
 		# Implementation is not clear if we need to sample a_t1 twice
-		print(f"Input shape state: {np.shape(s_t1)}")
-		print(f"Input shape action: {np.shape(a_t1)}")
+		logger.debug("Input shape state: %s", np.shape(s_t1), extra=HOT)
+		logger.debug("Input shape action: %s", np.shape(a_t1), extra=HOT)
 		if which == 1:
 			q_values = self.phi_1([s_t1, a_t1])
 		elif which == 2:
@@ -180,11 +188,10 @@ class SoftActorCritic():
 		adam = Adam(lr=self.lr_qfunc)
 		phi_2.compile(loss='mse', optimizer=adam)
 
-		print(
-			f"qfuncs_update: Input shape: ({state_t.shape},{action_t.shape})")
+		logger.debug("qfuncs_update: Input shape: (%s,%s)", state_t.shape, action_t.shape, extra=HOT)
 		q_val_throttle = targets[:,0]
 		q_val_steering = targets[:,1]
-		print(f"qfuncs_update: output shape: ({q_val_throttle.shape},{q_val_steering.shape})")
+		logger.debug("qfuncs_update: output shape: (%s,%s)", q_val_throttle.shape, q_val_steering.shape, extra=HOT)
 		phi_1.train_on_batch([state_t, action_t], [
 								q_val_throttle, q_val_steering])
 		phi_2.train_on_batch([state_t, action_t], [q_val_throttle, q_val_steering])
@@ -196,16 +203,31 @@ class SoftActorCritic():
 		# *			Because -> The agent update itself at each train on memory
 		pass
 	
+	def warm_up(self):
+		return self.policy.actor_inference.warm_up()
+
 	def load_model(self, path, name):
-		self.policy.actor_network.load_weights(path + "policy_" + name)
-		self.policy.phi_1.load_weights(path + "phi_1_" + name)
-		self.policy.phi_2.load_weights(path + "phi_2_" + name)
+		# The files written by save_model
+		for model, file_name in self.weights_files(path, name):
+			model.load_weights(file_name)
 	# Save the model which is under training
 
 	def save_model(self, path, name):
-		self.policy.actor_network.save_weights(path + "policy_" + name)
-		self.phi_1.save_weights(path + "phi_1_" + name)
-		self.phi_2.save_weights(path + "phi_2_" + name)
+		for model, file_name in self.weights_files(path, name):
+			model.save_weights(file_name)
+
+	def weights_files(self, path, name):
+		# Models to save, with their file
+		return [(self.policy.actor_network, h5_file_name(path + "policy_" + name)),
+				(self.phi_1, h5_file_name(path + "phi_1_" + name)),
+				(self.phi_2, h5_file_name(path + "phi_2_" + name))]
+
+	def get_policy_weights(self):
+		# Weights needed to choose actions, published by the learner to its actors
+		return self.policy.actor_network.get_weights()
+
+	def set_policy_weights(self, weights):
+		self.policy.actor_network.set_weights(weights)
 
 	def soft_net_update(self, net_old, net_new, TAU=0.8):
 		# TODO: put TAU in config.py
@@ -290,11 +312,11 @@ class SoftActorCritic():
 		return net_new
 
 	def compute_targets(self, r, s_t1, done):
-		print(f"s_t1 shape: {np.shape(s_t1)}")
+		logger.debug("s_t1 shape: %s", np.shape(s_t1), extra=HOT)
 		a_t1 = self.choose_action(s_t1, concat=True)
 		# actions = np.concatenate([action_throttle, action_steering], axis=1)
-		print(f"a_t1 shape : {a_t1.shape}")
-		print(f"a_t1 : {a_t1}")
+		logger.debug("a_t1 shape : %s", a_t1.shape, extra=HOT)
+		logger.debug("a_t1 : %s", a_t1, extra=HOT)
 
 		# When done, eon (Expectation of n? (next action maybe)) is not necessary
 		# 	Be carefull to check if it can be none and if it can break code
@@ -308,51 +330,55 @@ class SoftActorCritic():
 		probability_to_draw_action = self.policy.policy_probability(s_t1)
 		lr_action = (self.lr_qfunc * np.log(probability_to_draw_action))
 		
-		print(f"lr_action shape: {lr_action.shape}")
-		print(f"lr_action : {lr_action}")
+		logger.debug("lr_action shape: %s", lr_action.shape, extra=HOT)
+		logger.debug("lr_action : %s", lr_action, extra=HOT)
 		pred_q = self.qfunc_predict(s_t1, a_t1, which=0)
-		print(f"pred_q shape: {pred_q.shape}")
-		print(f"pred_q : {pred_q}")
+		logger.debug("pred_q shape: %s", pred_q.shape, extra=HOT)
+		logger.debug("pred_q : %s", pred_q, extra=HOT)
 		eon = pred_q - lr_action
 		eon = tf.cast(eon, tf.float64)
-		print(f"eon : {eon}")
-		print(f"done shape: {done.shape}")
+		logger.debug("eon : %s", eon, extra=HOT)
+		logger.debug("done shape: %s", done.shape, extra=HOT)
 
-		print(f"done: {done}")
+		logger.debug("done: %s", done, extra=HOT)
 		done = tf.constant(done, dtype=tf.float64)
-		print(f"done: {done}")
-		print(f"self.discount_factor: {self.discount_factor}")
+		logger.debug("done: %s", done, extra=HOT)
+		logger.debug("self.discount_factor: %s", self.discount_factor, extra=HOT)
 		discount_factor = tf.constant(self.discount_factor, dtype=tf.float64)
-		print(f"discount_factor: {discount_factor}")
+		logger.debug("discount_factor: %s", discount_factor, extra=HOT)
 		on_off_grad = discount_factor * (1 - done)
-		print(f"on_off_grad: {on_off_grad}")
+		logger.debug("on_off_grad: %s", on_off_grad, extra=HOT)
 		on_off_grad = tf.reshape(on_off_grad, (-1, 1))
-		print(f"on_off_grad reshape: {on_off_grad}")
+		logger.debug("on_off_grad reshape: %s", on_off_grad, extra=HOT)
 		on_off_grad = tf.concat([on_off_grad, on_off_grad], axis=1)
 		on_off_grad = tf.cast(on_off_grad, tf.float64)
-		print(f"on_off_grad concat: {on_off_grad}")
+		logger.debug("on_off_grad concat: %s", on_off_grad, extra=HOT)
 		# on_off_grad = on_off_grad.numpy().tolist()
 		# print(on_off_grad)
 		# on_off_grad = tf.constant(on_off_grad)
 		# print(on_off_grad)
 		# on_off_grad = tf.cast()
-		print(f"on_off_grad shape: {on_off_grad.shape}")
-		print(f"eon shape: {eon.shape}")
-		print(eon)
+		logger.debug("on_off_grad shape: %s", on_off_grad.shape, extra=HOT)
+		logger.debug("eon shape: %s", eon.shape, extra=HOT)
+		logger.debug("eon: %s", eon, extra=HOT)
 		r = tf.constant(r)
 		r = tf.reshape(r, (-1, 1))
 		r = tf.concat([r, r], axis=1)
-		print(f"r shape: {r.shape}")
-		print(r)
+		logger.debug("r shape: %s", r.shape, extra=HOT)
+		logger.debug("r: %s", r, extra=HOT)
 		targets = tf.add(r, tf.multiply(on_off_grad, eon))
-		print(f"targets shape: {targets.shape}")
-		print(targets)
+		logger.debug("targets shape: %s", targets.shape, extra=HOT)
+		logger.debug("targets: %s", targets, extra=HOT)
 		return targets
 
-	def train_on_memory(self, replay_bufer):
+	def train_on_memory(self, replay_bufer, max_batches=None):
+		# By default, the whole replay buffer is used then cleared
 		if len(replay_bufer) < self.batch_size:
-			return
-		for i in range(len(replay_bufer) // self.batch_size):
+			return False
+		nb_batches = len(replay_bufer) // self.batch_size
+		if max_batches:
+			nb_batches = min(nb_batches, max_batches)
+		for i in range(nb_batches):
 			# * Create batch
 			batch = []
 			for _ in range(self.batch_size):
@@ -363,49 +389,62 @@ class SoftActorCritic():
 			state_t, action_t, reward_t, state_t1, done, _ = zip(*batch)
 
 			state_t = np.concatenate(state_t, axis=0)
-			action_t = np.array(action_t)
-			print(f"Action_t: {action_t}")
-			print(f"Action_t shape: {action_t.shape}")
-			# action_t = np.concatenate(action_t, axis=1)
-			# print(f"reward: {reward_t}")
-			reward_t = np.array(reward_t)
-			# print(f"reward: {reward_t}")
 			state_t1 = np.concatenate(state_t1, axis=0)
-			print(f"done: {done}")
-			done = np.array(done).astype(int)
-			print(f"done: {done}")
-
-			# line 12:
-			# * Compute targets
-			targets = self.compute_targets(reward_t, state_t1, done)
-
-			# line 13:
-			# * Compute the update Q_functions estimators phi_1 & phi_2
-			phi_1, phi_2 = self.qfuncs_update(state_t, action_t, targets)
-
-			# line 14:
-			# * Update Policy, w/ gradient acent:
-			# ? Not sure how to, reference back to pseudocode from here : https://spinningup.openai.com/en/latest/algorithms/sac.html#pseudocode
-			# TODO: Once policy is implemented
-			qvals = self.qfunc_predict(state_t, action_t)
-			qvals = tf.cast(qvals, tf.float64)
-			pol_prob = self.policy.policy_probability(state_t)
-			pol_prob = tf.cast(pol_prob, tf.float64)
-
-			policy_reward = qvals - pol_prob
-			self.policy.update(state_t, action_t, policy_reward)
-
-			# line 15:
-			# * Soft update the target networks
-			debug = False
-			# debug = True
-			if not debug:
-				self.phi_1 = phi_1
-				self.phi_2 = phi_2
-			else:
-				self.phi_1 = self.soft_net_update(self.phi_1, phi_1)
-				self.phi_2 = self.soft_net_update(self.phi_2, phi_2)
-		replay_bufer.clear()
+			self.train_on_batch(state_t, action_t, reward_t, state_t1, done)
+		if not max_batches:
+			replay_bufer.clear()
+		return True
+
+	def train_on_batch(self, state_t, action_t, reward_t, state_t1, done):
+		"""
+			One update of the Q functions and the policy on a batch of transitions,
+			given as arrays (or sequences) of same length
+		"""
+		action_t = np.array(action_t)
+		logger.debug("Action_t: %s", action_t, extra=HOT)
+		logger.debug("Action_t shape: %s", action_t.shape, extra=HOT)
+		# action_t = np.concatenate(action_t, axis=1)
+		# print(f"reward: {reward_t}")
+		reward_t = np.array(reward_t)
+		# print(f"reward: {reward_t}")
+		logger.debug("done: %s", done, extra=HOT)
+		done = np.array(done).astype(int)
+		logger.debug("done: %s", done, extra=HOT)
+
+		# line 12:
+		# * Compute targets
+		targets = self.compute_targets(reward_t, state_t1, done)
+
+		# line 13:
+		# * Compute the update Q_functions estimators phi_1 & phi_2
+		phi_1, phi_2 = self.qfuncs_update(state_t, action_t, targets)
+
+		# line 14:
+		# * Update Policy, w/ gradient acent:
+		# ? Not sure how to, reference back to pseudocode from here : https://spinningup.openai.com/en/latest/algorithms/sac.html#pseudocode
+		# TODO: Once policy is implemented
+		qvals = self.qfunc_predict(state_t, action_t)
+		qvals = tf.cast(qvals, tf.float64)
+		pol_prob = self.policy.policy_probability(state_t)
+		pol_prob = tf.cast(pol_prob, tf.float64)
+
+		policy_reward = qvals - pol_prob
+		self.policy.update(state_t, action_t, policy_reward)
+
+		# line 15:
+		# * Soft update the target networks
+		debug = False
+		# debug = True
+		if not debug:
+			self.phi_1 = phi_1
+			self.phi_2 = phi_2
+		else:
+			self.phi_1 = self.soft_net_update(self.phi_1, phi_1)
+			self.phi_2 = self.soft_net_update(self.phi_2, phi_2)
+
+	def train_step(self, replay_bufer):
+		# A single gradient step, on one batch
+		return self.train_on_memory(replay_bufer, max_batches=1)
 
 
 if __name__ == "__main__":
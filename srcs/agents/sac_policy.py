@@ -5,6 +5,11 @@ import tensorflow.keras as keras
 import tensorflow.keras.layers as layers
 import tensorflow.keras.initializers as initializers
 import math
+from logs import get_logger, HOT
+from normalization import frames_input
+from inference import CompiledModel
+
+logger = get_logger(__name__)
 # from keras.layers import Dropout
 
 class GaussianPolicy():
@@ -18,7 +23,8 @@ class GaussianPolicy():
 					bias_mu_steering=0.0,
 					bias_sigma_throttle=0.03, # ~1% outside (0.5 +- 0.4)
 					bias_sigma_steering=0.1, # ~2% outside (0 +- 0.9)
-					learning_rate=0.001):
+					learning_rate=0.001,
+					scale_frames=True):
 		"""
 			Summary:
 				In the continuous variant, we usually draw actions from a Gaussian distribution;
@@ -34,6 +40,8 @@ class GaussianPolicy():
 					a feature array ϕ(s), followed by one or more hidden layers that transform the input
 				output_size ([type]):
 					The output being μ and σ
+				scale_frames (bool):
+					False for the networks trained on frames in [0, 255], see ScaleFrames
 		"""
 		# Create actor network
 		# bias 0.0 yields mu=0.0 with linear activation function
@@ -44,6 +52,7 @@ class GaussianPolicy():
 		self.bias_sigma_steering = bias_sigma_steering
 
 		self.lr = learning_rate
+		self.scale_frames = scale_frames
 
 		self.actor_network = self.build_model(
                    				input_shape,  # input dimension is (1,) for testor
@@ -55,6 +64,8 @@ class GaussianPolicy():
 		self.opt = keras.optimizers.Adam(learning_rate=self.lr)
 		self.actor_network.compile(loss='mse', optimizer=self.opt)
 		self.actor_network.summary()
+		# Actions are chosen one state at a time: an eager call is too slow for it
+		self.actor_inference = CompiledModel(self.actor_network)
 
 		# For debugging purposes
 		self.loss_ = 0
@@ -75,10 +86,8 @@ class GaussianPolicy():
 		"""
 			Construct the actor network with mu and sigma as output
 		"""
-		print(f"Input shape of policy: {input_shape}")
-		inputs = layers.Input(shape=input_shape)
-
-		prev_layer = inputs
+		logger.info("Input shape of policy: %s", input_shape)
+		inputs, prev_layer = frames_input(input_shape, self.scale_frames)
 		for i in range(number_of_layers):
 
 			current_layer = layers.Dense(neurons_by_layers,
@@ -116,23 +125,28 @@ class GaussianPolicy():
 
 		return actor_network
 
-	def choose_action(self, state, one=False, constrained=False):
+	def choose_action(self, state, one=False, constrained=False, deterministic=False):
 		# Obtain mu and sigma from network
-		print(f"state shape: {state.shape}")
-		self.mu_throttle, self.sigma_throttle, self.mu_steering, self.sigma_steering = self.actor_network(state)
-		print(f"sigma_throttle shape: {self.sigma_throttle.shape}")
-		print(f"mu_throttle shape: {self.mu_throttle.shape}")
-		print(f"sigma_steering shape: {self.sigma_steering.shape}")
-		print(f"mu_steering shape: {self.mu_steering.shape}")
+		logger.debug("state shape: %s", state.shape, extra=HOT)
+		self.mu_throttle, self.sigma_throttle, self.mu_steering, self.sigma_steering = self.actor_inference(state)
+		logger.debug("sigma_throttle shape: %s", self.sigma_throttle.shape, extra=HOT)
+		logger.debug("mu_throttle shape: %s", self.mu_throttle.shape, extra=HOT)
+		logger.debug("sigma_steering shape: %s", self.sigma_steering.shape, extra=HOT)
+		logger.debug("mu_steering shape: %s", self.mu_steering.shape, extra=HOT)
 
 		# TODO: IT'S A QUICK FIX TO SEE IF IT WORKS -> WILL BREAK IN THE LONG TERM !!!!
 		# if len(state.shape) == 4:
 		# 	m = [1, state.shape[0]]
 		# else:
 		# 	m = [1]
-		# Draw action from normal distribution
-		action_throttle = tf.random.normal(self.mu_throttle.shape, mean=self.mu_throttle, stddev=self.sigma_throttle)
-		action_steering = tf.random.normal(self.mu_throttle.shape, mean=self.mu_steering, stddev=self.sigma_steering)
+		if deterministic:
+			# Most likely action, used for evaluation
+			action_throttle = self.mu_throttle
+			action_steering = self.mu_steering
+		else:
+			# Draw action from normal distribution
+			action_throttle = tf.random.normal(self.mu_throttle.shape, mean=self.mu_throttle, stddev=self.sigma_throttle)
+			action_steering = tf.random.normal(self.mu_throttle.shape, mean=self.mu_steering, stddev=self.sigma_steering)
 
 		action_throttle = action_throttle.numpy().reshape(-1, 1)
 		action_steering = action_steering.numpy().reshape(-1, 1)
@@ -147,7 +161,7 @@ class GaussianPolicy():
 		if one:
 			return action_steering
 
-		print(f"actions throt shape: {action_throttle.shape}")
+		logger.debug("actions throt shape: %s", action_throttle.shape, extra=HOT)
 		# print(f"actions shape: {action_steering.shape}")
 		# actions = np.concatenate([action_throttle, action_steering], axis=1)
 		# return actions
@@ -163,24 +177,24 @@ class GaussianPolicy():
 
 		def prob_dis(x, m, s):
 			#  $ f(x, \mu, \sigma) = \frac{1}{\sigma\sqrt{2\pi}}e ^\frac{-(x -\mu) ^ 2}{2\sigma ^ 2} $
-			print(f"x.shape {tf.shape(x)}")
-			print(f"mu.shape {tf.shape(m)}")
-			print(f"sig.shape {tf.shape(s)}")
+			logger.debug("x.shape %s", x.shape, extra=HOT)
+			logger.debug("mu.shape %s", m.shape, extra=HOT)
+			logger.debug("sig.shape %s", s.shape, extra=HOT)
 			pi = tf.constant(math.pi)
 			sig_sqrt = s * tf.math.sqrt(2 * pi)
-			print(f"sig_sqrt.shape {tf.shape(sig_sqrt)}")
+			logger.debug("sig_sqrt.shape %s", sig_sqrt.shape, extra=HOT)
 			expo = tf.math.exp(- tf.math.pow(x - m, 2) / (2 * tf.math.pow(s, 2)))
-			print(f"expo.shape {tf.shape(expo)}")
+			logger.debug("expo.shape %s", expo.shape, extra=HOT)
 			return (1 / sig_sqrt) * expo 
 
 		prob_t = prob_dis(a_t, mu_t, si_t)
-		print(f"prob_t.shape {tf.shape(prob_t)}")
+		logger.debug("prob_t.shape %s", prob_t.shape, extra=HOT)
 		prob_s = prob_dis(a_s, mu_s, si_s)
-		print(f"prob_s.shape {tf.shape(prob_s)}")
+		logger.debug("prob_s.shape %s", prob_s.shape, extra=HOT)
 
 		probability_to_draw_action = prob_t * prob_s
-		print(f"prob.shape {tf.shape(probability_to_draw_action)}")
-		print(f"prob {probability_to_draw_action}")
+		logger.debug("prob.shape %s", probability_to_draw_action.shape, extra=HOT)
+		logger.debug("prob %s", probability_to_draw_action, extra=HOT)
 		return probability_to_draw_action
 
 	def custom_loss_gaussian(self, state, action, reward, debug=False):
@@ -200,8 +214,8 @@ class GaussianPolicy():
 		action_steering = action[:, 1]
 		action_throttle = tf.reshape(action_throttle, (-1, 1))
 		action_steering = tf.reshape(action_steering, (-1, 1))
-		print(f"action_throttle shape: {action_throttle.shape}")
-		print(f"action_steering shape: {action_steering.shape}")
+		logger.debug("action_throttle shape: %s", action_throttle.shape, extra=HOT)
+		logger.debug("action_steering shape: %s", action_steering.shape, extra=HOT)
 
 		# * Predict mu and sigma with actor network
 		mu_throttle, sigma_throttle, mu_steering, sigma_steering = self.actor_network(state)
@@ -212,8 +226,8 @@ class GaussianPolicy():
 		sigma_throttle = tf.cast(sigma_throttle, tf.float64)
 		mu_steering = tf.cast(mu_steering, tf.float64)
 		sigma_steering = tf.cast(sigma_steering, tf.float64)
-		print(f"mu_throttle shape: {mu_throttle.shape}")
-		print(f"sigma_throttle shape: {sigma_throttle.shape}")
+		logger.debug("mu_throttle shape: %s", mu_throttle.shape, extra=HOT)
+		logger.debug("sigma_throttle shape: %s", sigma_throttle.shape, extra=HOT)
 
 
 		# * Compute Gaussian probability distribution function value
@@ -228,16 +242,16 @@ class GaussianPolicy():
 		log_probability_steering = tf.math.log(pdf_value_steering + 1e-5)
 
 		if debug:
-			print(f"PDF t: {float(log_probability_throttle):9.5}")
-			print(f"PDF s: {float(log_probability_steering):9.5}")
+			logger.debug("PDF t: %9.5g", float(log_probability_throttle), extra=HOT)
+			logger.debug("PDF s: %9.5g", float(log_probability_steering), extra=HOT)
 		# * Compute weighted loss
 		# TODO: check if multiplication is **really** the good way to combine a double log_probability
 		# Using absolute value do NOT work.
 		self.loss_ = - reward * ((log_probability_throttle) + (log_probability_steering))
 		if debug:
-			print(f"Loss: {self.loss_}")
+			logger.debug("Loss: %s", self.loss_, extra=HOT)
 
-		print(f"Loss: {self.loss_}")
+		logger.debug("Loss: %s", self.loss_, extra=HOT)
 
 		return self.loss_
 
@@ -0,0 +1,187 @@
+import numpy as np
+import tensorflow as tf
+from config import config
+
+
+def solve_homographies(src, dst):
+	"""
+		Homographies mapping the 4 points of `src` on the 4 points of `dst`, like Augmentor's Skew
+
+		Args:
+			src, dst (np.ndarray): of shape (B, 4, 2)
+
+		Returns:
+			np.ndarray: of shape (B, 3, 3)
+	"""
+	batch = len(src)
+	A = np.zeros((batch, 8, 8))
+	x, y = src[..., 0], src[..., 1]
+	u, v = dst[..., 0], dst[..., 1]
+	A[:, 0::2, 0] = x
+	A[:, 0::2, 1] = y
+	A[:, 0::2, 2] = 1
+	A[:, 0::2, 6] = -u * x
+	A[:, 0::2, 7] = -u * y
+	A[:, 1::2, 3] = x
+	A[:, 1::2, 4] = y
+	A[:, 1::2, 5] = 1
+	A[:, 1::2, 6] = -v * x
+	A[:, 1::2, 7] = -v * y
+	b = dst.reshape(batch, 8)
+	coeffs = np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+	return np.concatenate([coeffs, np.ones((batch, 1))], axis=1).reshape(batch, 3, 3)
+
+
+def augment_batch(frames, rng=None):
+	"""
+		Random transforms of create_augmentor_pipeline, done in memory on a batch of
+		preprocessed frames: rotate90, small rotations (cropped and zoomed back, like Augmentor)
+		and left / right skews. Frames are already resized and gray.
+
+		All the transforms of a frame are composed in one homography,
+		so a transformed frame is resampled once, bilinearly, whatever the transforms.
+
+		Args:
+			frames (np.ndarray): uint8 frames of shape (B, rows, cols)
+			rng (np.random.Generator, optional): Defaults to a new generator.
+
+		Returns:
+			np.ndarray: uint8 augmented frames of the same shape
+	"""
+	rng = rng or np.random.default_rng()
+	batch, rows, cols = frames.shape
+	center = np.array([cols / 2, rows / 2])
+	# Output pixel -> input pixel, in coordinates where pixel (i, j) is centered on (j + 0.5, i + 0.5)
+	H = np.tile(np.eye(3), (batch, 1, 1))
+
+	rot90 = rng.random(batch) < config.augment_rotate90
+	if rot90.any():
+		# Counterclockwise, like np.rot90: out(x, y) = in(cols - y, x)
+		R = np.array([[0, -1, cols], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+		H[rot90] = H[rot90] @ R
+
+	rotate = rng.random(batch) < config.augment_rotate
+	if rotate.any():
+		angles = np.radians(rng.uniform(-config.augment_max_left_rotation,
+										config.augment_max_right_rotation,
+										rotate.sum()))
+		cos, sin = np.cos(angles), np.sin(angles)
+		# Zoom so that no border of the rotated frame is visible
+		zoom = np.abs(cos) + np.abs(sin)
+		R = np.tile(np.eye(3), (len(angles), 1, 1))
+		R[:, 0, 0], R[:, 0, 1] = cos / zoom, -sin / zoom
+		R[:, 1, 0], R[:, 1, 1] = sin / zoom, cos / zoom
+		R[:, :2, 2] = center - R[:, :2, :2] @ center
+		H[rotate] = H[rotate] @ R
+
+	skew = rng.random(batch) < config.augment_skew
+	if skew.any():
+		nb_skews = skew.sum()
+		amounts = rng.integers(1, int(np.ceil(max(rows, cols) * config.augment_skew_magnitude)) + 1, nb_skews)
+		corners = np.array([[0, 0], [cols, 0], [cols, rows], [0, rows]], dtype=np.float64)
+		skewed = np.tile(corners, (nb_skews, 1, 1))
+		# The left or the right edge is stretched, its corners go out of the frame
+		left = rng.random(nb_skews) < 0.5
+		edge = np.where(left[:, np.newaxis], [0, 3], [1, 2])
+		top, bottom = edge[:, 0], edge[:, 1]
+		index = np.arange(nb_skews)
+		skewed[index, top, 1] -= amounts
+		skewed[index, bottom, 1] += amounts
+		# Like Augmentor: the skewed corners of the output are the corners of the input
+		H[skew] = H[skew] @ solve_homographies(skewed, np.tile(corners, (nb_skews, 1, 1)))
+
+	augmented = frames.copy()
+	# Most frames are not transformed: only the others are resampled
+	transformed = rot90 | rotate | skew
+	if transformed.any():
+		augmented[transformed] = warp_batch(frames[transformed], H[transformed])
+	return augmented
+
+
+def warp_batch(frames, H):
+	"""
+		Bilinear resampling of each frame by its homography H (output -> input), black outside
+	"""
+	batch, rows, cols = frames.shape
+	y, x = np.mgrid[0:rows, 0:cols] + 0.5
+	points = np.stack([x.ravel(), y.ravel(), np.ones(rows * cols)])
+	mapped = H @ points
+	src_x = mapped[:, 0] / mapped[:, 2] - 0.5
+	src_y = mapped[:, 1] / mapped[:, 2] - 0.5
+	x0 = np.floor(src_x).astype(np.int64)
+	y0 = np.floor(src_y).astype(np.int64)
+	wx = src_x - x0
+	wy = src_y - y0
+	images = frames.reshape(batch, -1).astype(np.float32)
+	index = np.arange(batch)[:, np.newaxis]
+	result = np.zeros((batch, rows * cols), dtype=np.float32)
+	for dy, dx, w in ((0, 0, (1 - wy) * (1 - wx)), (0, 1, (1 - wy) * wx),
+						(1, 0, wy * (1 - wx)), (1, 1, wy * wx)):
+		xs, ys = x0 + dx, y0 + dy
+		inside = (xs >= 0) & (xs < cols) & (ys >= 0) & (ys < rows)
+		pixels = images[index, np.clip(ys, 0, rows - 1) * cols + np.clip(xs, 0, cols - 1)]
+		result += np.where(inside, pixels * w, 0)
+	return np.clip(np.rint(result), 0, 255).astype(np.uint8).reshape(frames.shape)
+
+
+def frames_dataset(frames, indexes=None, batch_size=config.batch_size, shuffle=True):
+	"""
+		tf.data pipeline of batches of `frames`, of shape (N, rows, cols), read by index:
+		a memmap (like the packed dataset of Preprocessing.build_dataset) is never loaded whole.
+
+		Args:
+			indexes (np.ndarray, optional): frames used, like the train or test ones. Defaults to all the frames.
+
+		Returns:
+			tf.data.Dataset: of uint8 batches of shape (B, rows, cols, 1)
+	"""
+	frames = np.asarray(frames)
+	if indexes is None:
+		indexes = np.arange(len(frames))
+	dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indexes, dtype=np.int64))
+	if shuffle:
+		dataset = dataset.shuffle(len(indexes), reshuffle_each_iteration=True)
+	dataset = dataset.batch(batch_size)
+
+	def load(indexes):
+		# Sorted indexes read a memmap sequentially
+		return frames[np.sort(indexes)]
+
+	def load_batch(indexes):
+		batch = tf.numpy_function(load, [indexes], tf.uint8)
+		return tf.reshape(batch, (-1, *frames.shape[1:], 1))
+
+	return dataset.map(load_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+
+def augmented_dataset(frames, indexes=None, batch_size=config.batch_size, shuffle=True):
+	"""
+		tf.data pipeline for AutoEncoder training on `frames`, of shape (N, rows, cols):
+		batches are augmented by parallel workers while the model trains on the previous ones.
+		The augmentations are drawn again each epoch, and only the original frames are in memory.
+
+		Returns:
+			tf.data.Dataset: of (inputs, targets) uint8 batches of shape (B, rows, cols, 1),
+				normalized by the models
+	"""
+	return augment_batches(frames_dataset(frames, indexes, batch_size, shuffle))
+
+
+def augment_batches(dataset):
+	"""
+		Augments the batches of uint8 frames of shape (B, rows, cols, 1) of `dataset`,
+		in parallel, and prefetches them for training
+
+		Returns:
+			tf.data.Dataset: of (inputs, targets) uint8 batches of the same shape
+	"""
+	def augment(batch):
+		return augment_batch(batch[..., 0])[..., np.newaxis]
+
+	def augment_pair(batch):
+		augmented = tf.numpy_function(augment, [batch], tf.uint8)
+		augmented.set_shape(batch.shape)
+		return augmented, augmented
+
+	dataset = dataset.map(augment_pair, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+	return dataset.prefetch(tf.data.experimental.AUTOTUNE)
@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import threading
+from collections import deque
+import tensorflow as tf
+from config import config
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class CheckpointManager():
+	def __init__(self,
+					agent,
+					path,
+					name,
+					every_episodes=config.checkpoint_every_episodes,
+					every_seconds=config.checkpoint_every_seconds,
+					keep=config.checkpoint_keep):
+		'''
+			Saves the agent's models without blocking the driving loop.
+			Weights are copied in memory on the caller's thread, then written by a
+			background thread in a temporary file renamed over the previous checkpoint,
+			so a crash during a write never leaves a corrupted model in model_cache.
+
+			Files are written with the same names as agent.save_model, in h5 format
+			(agent.weights_files gives the .h5 suffix to the names without it),
+			and the last `keep` checkpoints are also kept as <name>_<episode>.
+
+			Args:
+				agent: DQNAgent or SoftActorCritic
+				path (str): folder of the models
+				name (str): name of the model, as given to agent.save_model
+				every_episodes (int, optional): save every K episodes, 0 to disable.
+					Defaults to config.checkpoint_every_episodes.
+				every_seconds (float, optional): save when T seconds passed since the last save, 0 to disable.
+					Defaults to config.checkpoint_every_seconds.
+				keep (int, optional): number of previous checkpoints kept. Defaults to config.checkpoint_keep.
+		'''
+		self.agent = agent
+		self.path = path
+		self.name = name
+		self.every_episodes = every_episodes
+		self.every_seconds = every_seconds
+		self.keep = keep
+		self.last_save = time.time()
+		# Models with the architecture of the agent's ones, only used by the writer thread
+		self.shadows = {}
+		self.history = {}
+		self.pending = None
+		self.stopped = False
+		self.condition = threading.Condition()
+		self.thread = threading.Thread(target=self.writer_loop, daemon=True)
+		self.thread.start()
+
+	def maybe_save(self, episode):
+		'''
+			Must be called at the end of each episode, saves if one of the periods is over
+		'''
+		due_episodes = self.every_episodes and (episode + 1) % self.every_episodes == 0
+		due_seconds = self.every_seconds and time.time() - self.last_save >= self.every_seconds
+		if due_episodes or due_seconds:
+			self.save(episode)
+
+	def save(self, episode):
+		snapshot = []
+		for model, file_name in self.agent.weights_files(self.path, self.name):
+			if file_name not in self.shadows:
+				self.shadows[file_name] = tf.keras.models.clone_model(model)
+			snapshot.append((file_name, model.get_weights()))
+		self.last_save = time.time()
+		with self.condition:
+			# An older snapshot still waiting is outdated
+			self.pending = (episode, snapshot)
+			self.condition.notify()
+
+	def write(self, episode, file_name, weights):
+		shadow = self.shadows[file_name]
+		shadow.set_weights(weights)
+		root, ext = os.path.splitext(file_name)
+		tmp_file = f"{root}.tmp{ext}"
+		shadow.save_weights(tmp_file, save_format="h5")
+		if self.keep:
+			versioned = f"{root}_{episode}{ext}"
+			shutil.copyfile(tmp_file, versioned)
+			history = self.history.setdefault(file_name, deque())
+			history.append(versioned)
+			while len(history) > self.keep:
+				old = history.popleft()
+				if os.path.exists(old):
+					os.remove(old)
+		# Atomic: readers see either the previous or the new checkpoint
+		os.replace(tmp_file, file_name)
+
+	def writer_loop(self):
+		while True:
+			with self.condition:
+				while self.pending is None and not self.stopped:
+					self.condition.wait()
+				if self.pending is None:
+					return
+				episode, snapshot = self.pending
+				self.pending = None
+			for file_name, weights in snapshot:
+				try:
+					self.write(episode, file_name, weights)
+				except Exception as e:
+					logger.error("Checkpoint of %s failed: %s", file_name, e)
+
+	def close(self):
+		'''
+			Waits for the last snapshot to be written
+		'''
+		with self.condition:
+			self.stopped = True
+			self.condition.notify()
+		self.thread.join()
@@ -36,6 +36,10 @@ config.sim_img_channels = 3
 config.sim_img_shape = (config.sim_img_rows,
                         config.sim_img_cols,
 						config.sim_img_channels)
+# A simulator step or reset taking more seconds than this is considered hung, 0 disables the timeout
+config.sim_step_timeout = 30
+# Crashed or hung simulators are replaced at most this number of times by run
+config.sim_max_restarts = 10
 
 
 
@@ -54,6 +58,20 @@ config.prep_img_shape = (config.prep_img_rows,
 # size of the vector at the encoder output
 config.output_shape = 128 
 config.encoder_output_shape = 128 
+# With --latent, a state is the stack of the encoded frames instead of the frames
+config.latent_shape = (config.encoder_output_shape,
+                       config.prep_img_channels)
+# The encoder is trained on frames without the sky (Image_crop): the frames
+# of its dataset and the frames it encodes are cropped according to this flag
+config.encoder_crop = True
+# With --latent, bytes of the latents cached by frame (EncoderCache), 0 disables the cache
+config.encoder_cache_bytes = 64 * 2 ** 20
+# Dataset builder of the AutoEncoder: worker processes (None uses every cpu)
+# and number of images sent to a worker at once
+config.prep_workers = None
+config.prep_chunk_size = 256
+# Sidecar of the dataset: source file names and train / test split of its images
+config.dataset_index_sufix = "_index.json"
 
 
 
@@ -62,6 +80,103 @@ config.encoder_output_shape = 128
 # ----------------------------
 config.epochs=100
 config.batch_size=128
+# Random transforms of the AutoEncoder training frames, with the settings of
+# Preprocessing.create_augmentor_pipeline: probabilities and rotation angles (degrees)
+config.augment_rotate90 = 0.1
+config.augment_rotate = 0.2
+config.augment_max_left_rotation = 5
+config.augment_max_right_rotation = 10
+config.augment_skew = 0.1
+config.augment_skew_magnitude = 1
+
+
+
+
+# ----------------
+# Actor / Learner
+# ----------------
+# Weights are sent to the actors every `learner_publish_every` updates
+config.learner_publish_every = 10
+# Transitions waiting for the learner, actors drop new ones when it is full
+config.actor_queue_size = 1_000
+# Seconds the learner waits for transitions when it has nothing to train on
+config.learner_wait_time = 1
+# Seconds given to actors to close their simulator before being terminated
+config.actor_join_timeout = 10
+
+
+
+
+# ----------------
+# Frame skip
+# ----------------
+# Simulator steps each chosen action is repeated for, only the last frame is stacked and stored
+config.frame_skip = 1
+
+
+
+
+# ----------------
+# Train scheduler
+# ----------------
+# Env steps between two trainings, 0 trains once by episode
+config.train_every = 0
+# Gradient steps by training, update-to-data ratio is gradient_steps / train_every
+config.gradient_steps = 1
+
+
+
+
+# ----------------
+# Offline training
+# ----------------
+# Epochs over the stored episodes with --no_sim --offline
+config.offline_epochs = 10
+# latent_extraction.py: worker processes encoding the stored episodes,
+# and frames per call of the encoder
+config.latent_workers = 2
+config.latent_batch_size = 256
+
+
+
+
+# ----------------
+# Checkpoints
+# ----------------
+# Models are saved every K episodes and/or every T seconds, 0 disables the period
+config.checkpoint_every_episodes = 1
+config.checkpoint_every_seconds = 0
+# Number of previous checkpoints kept next to the last one
+config.checkpoint_keep = 3
+
+
+
+
+# ----------------
+# Evaluation
+# ----------------
+# An evaluation episode is completed when it reaches this number of steps
+config.eval_max_steps = 2_000
+
+
+
+
+# ----------------
+# Step timers
+# ----------------
+# Number of durations kept by stage for the percentiles
+config.timers_window = 1_000
+
+
+
+
+# ----------------
+# Logging
+# ----------------
+# Level of the messages shown, DEBUG shows the per-step messages of the driving loop
+config.log_level = "INFO"
+# Per-step messages are shown at most once by interval (seconds), 0 shows them all
+config.log_interval = 1.0
 
 
 
@@ -94,7 +209,11 @@ config.name_human_player = "HumanPlayer"
 config.local_memory_folder = "local_memory"
 config.s3_memory_folder = "memory"
 config.memory_sufix = ".pkl"
+config.latent_sufix = "_latents.npz"
 config.info_sufix = "_infos.json"
+config.timers_sufix = "_timers.jsonl"
+config.eval_sufix = "_eval.json"
+config.benchmark_sufix = "_benchmark.json"
 config.main_folder = get_path_to_cache("")
 config.bucket_name = "deyopotato"
 
@@ -10,9 +10,14 @@ import matplotlib.pyplot as plt
 from PIL import Image
 from tqdm import tqdm
 import pickle
+import zlib
+import hashlib
 from skimage.metrics import structural_similarity as ssim
 from config import config
 from utils_get_abs_path import get_path_to_cache
+from utils import read_json_file
+from augmentation import augmented_dataset, augment_batches, frames_dataset
+from normalization import frames_input
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras.layers import Input, Dense, Conv2D, MaxPooling2D, Conv2DTranspose, Flatten
@@ -21,6 +26,30 @@ from tensorflow.keras.models import Model
 from tensorflow.keras import backend as K
 from tensorflow.keras.callbacks import TensorBoard
 
+def binary_crossentropy_frames(y_true, y_pred):
+    """ Loss of the autoencoder: targets are the uint8 input images, outputs are in [0, 1] """
+    return keras.losses.binary_crossentropy(tf.cast(y_true, y_pred.dtype) / 255.0, y_pred)
+
+def is_test_file(name, test_size=0.2):
+    """ Deterministic split: a file is in the test set according to the hash of its name """
+    return zlib.crc32(name.encode("utf-8")) % 1000 < test_size * 1000
+
+def weights_checksum(weight_path):
+    """ Short sha256 of the files of the weights `weight_path` (weight_path.index, weight_path.data-...),
+    to know which encoder computed stored latents """
+    h = hashlib.sha256()
+    directory, prefix = os.path.split(weight_path)
+    for name in sorted(os.listdir(directory)):
+        if name.startswith(prefix):
+            with open(os.path.join(directory, name), "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()[:16]
+
+def dataset_index_path(dataset_file):
+    """ Sidecar index of a packed dataset: ./output/dataset.npy -> ./output/dataset_index.json """
+    return os.path.splitext(dataset_file)[0] + config.dataset_index_sufix
+
 class AutoEncoder():
     def __init__(self, input_shape: tuple = None, autoencoder_active = True):
         if not input_shape:
@@ -33,11 +62,16 @@ class AutoEncoder():
         else:
 			# TODO use config.encoder_output_shape from config.py for shape
             self.output_shape = config.output_shape
+        # Set by Loaded_Encoder
+        self.encoder_checksum = None
         print("output_shape",self.output_shape)
 
     def load_data(self, dir_path):
-        """ Loads all the images from directory `dir_path`, converts them to matrices and return a list."""
+        """ Loads all the images from directory `dir_path`, converts them to matrices and return a list.
+        `dir_path` can also be a .npy file written by Preprocessing.build_dataset """
 		# TODO: S3 Bucket integration
+        if dir_path.endswith('.npy'):
+            return np.load(dir_path, mmap_mode='r')
         files = os.listdir(dir_path)
         num_files = len(files)
         data = []
@@ -48,6 +82,57 @@ class AutoEncoder():
                 data.append(img_array)
         return data
 
+    def load_packed_data(self, npy_path):
+        """ Maps the packed dataset written by Preprocessing.build_dataset, without reading it:
+        the images are read from the page cache when the batches need them.
+        The split is the one of its sidecar index, or the hash of the image numbers without index.
+
+        Returns:
+            (frames, train_indexes, test_indexes): uint8 np.memmap of shape (N, rows, cols)
+            and the indexes of its train and test images
+        """
+        frames = np.load(npy_path, mmap_mode='r')
+        index_path = dataset_index_path(npy_path)
+        if os.path.exists(index_path):
+            index = read_json_file(index_path)
+            if len(index["split"]) != len(frames):
+                raise ValueError(f"{index_path} has {len(index['split'])} images, {npy_path} has {len(frames)}")
+            test = np.array([split == "test" for split in index["split"]], dtype=bool)
+        else:
+            test = np.array([is_test_file(str(i)) for i in range(len(frames))], dtype=bool)
+        return frames, np.flatnonzero(~test), np.flatnonzero(test)
+
+    def stream_data(self, dir_path, test_size=0.2, batch_size=config.batch_size):
+        """ Training data read from the png images of `dir_path`: images are decoded in parallel
+        while the model trains, so they are never all in memory.
+        Train images are shuffled and augmented on the fly, the split is done by is_test_file.
+
+        Returns:
+            (train_dataset, test_dataset): tf.data pipelines of (inputs, targets) uint8 batches
+        """
+        files = sorted(f for f in os.listdir(dir_path) if f.endswith('.png'))
+        test_files = [os.path.join(dir_path, f) for f in files if is_test_file(f, test_size)]
+        train_files = [os.path.join(dir_path, f) for f in files if not is_test_file(f, test_size)]
+        print(f'{len(train_files)} train images, {len(test_files)} test images')
+        image_shape = (config.prep_img_rows, config.prep_img_cols, 1)
+
+        def decode(path):
+            image = tf.io.decode_png(tf.io.read_file(path), channels=1)
+            image.set_shape(image_shape)
+            return image
+
+        def images(paths, shuffle):
+            dataset = tf.data.Dataset.from_tensor_slices(paths)
+            if shuffle:
+                # Only the file names are shuffled in memory, not the images
+                dataset = dataset.shuffle(len(paths), reshuffle_each_iteration=True)
+            dataset = dataset.map(decode, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+            return dataset.batch(batch_size)
+
+        train_dataset = augment_batches(images(train_files, shuffle=True))
+        test_dataset = images(test_files, shuffle=False).map(lambda batch: (batch, batch))
+        return train_dataset, test_dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
         ### Defining the Encoder
     def AutoEncoder_model(self, image_width,image_height):
         """create a autoencoder model with fixed architecture
@@ -55,11 +140,12 @@ class AutoEncoder():
         input size of images to autoencode
         return 3 models  """
         
-        input_img = Input(shape=(image_width, image_height, 1))
+        # uint8 images, scaled in [0, 1] by the model
+        input_img, x = frames_input((image_width, image_height, 1))
 		# TODO use config.encoder_output_shape from config.py for shape
         output_shape_encoded = self.output_shape
         # You can experiment with the encoder layers, i.e. add or change them
-        x = Conv2D(32, (3, 3), activation='relu', strides=2, padding='same')(input_img)
+        x = Conv2D(32, (3, 3), activation='relu', strides=2, padding='same')(x)
         x = Conv2D(64, (3, 3), activation='relu', strides=2, padding='same')(x)
 
         # We need this shape later in the decoder, so we save it into a variable.
@@ -100,6 +186,7 @@ class AutoEncoder():
         if weight_path =="":
             weight_path = get_path_to_cache("model_cache/encoder/encoder_weights")
         encoder.load_weights(weight_path)
+        self.encoder_checksum = weights_checksum(weight_path)
         return encoder
 
     def Prepare_input_data(self, data):
@@ -110,18 +197,29 @@ class AutoEncoder():
         train_data = np.array(train_data)
         test_data = np.array(test_data)
 
-        # Normalizing train and test data
-        normalized_train_data = train_data.astype('float32')/255.0
-        normalized_test_data = test_data.astype('float32')/255.0
-
+        # Data stays uint8, the models normalize it themselves
         # Reshaping train and test sets, i.e. changing from (64, 64) to (64, 64, 1)
-        normalized_train_data = np.expand_dims(normalized_train_data,axis=-1)
-        normalized_test_data = np.expand_dims(normalized_test_data,axis=-1)
-        print('Normalization and reshaping is done.')
+        normalized_train_data = np.expand_dims(train_data,axis=-1)
+        normalized_test_data = np.expand_dims(test_data,axis=-1)
+        print('Reshaping is done.')
         print('Input shape = {}'.format(normalized_train_data.shape[1:]))
 
         return normalized_train_data, normalized_test_data
 
+    def Prepare_packed_data(self, frames, train_indexes, test_indexes, batch_size=config.batch_size):
+        """ Training data read from the memmap of load_packed_data: train and test batches
+        are both read from it by index, nothing is copied beforehand.
+        Train images are shuffled and augmented on the fly
+
+        Returns:
+            (train_dataset, test_dataset): tf.data pipelines of (inputs, targets) uint8 batches
+        """
+        train_dataset = augmented_dataset(frames, train_indexes, batch_size=batch_size)
+        test_dataset = frames_dataset(frames, test_indexes, batch_size=batch_size, shuffle=False)
+        test_dataset = test_dataset.map(lambda batch: (batch, batch))
+        print('{} train and {} test images mapped.'.format(len(train_indexes), len(test_indexes)))
+        return train_dataset, test_dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
         # METRICS - VISUALIZATION ERROR
     def mse(self, imageA, imageB):
         # the 'Mean Squared Error' between the two images is the
@@ -172,8 +270,10 @@ class AutoEncoder():
             rand_num = np.random.randint(0, 200) 
         
             # To display the original image 
-            mse_img = self.mse(X_test[rand_num].reshape(image_width, image_width), reconstructed_images[rand_num].reshape(image_width, image_width))
-            ssim_img = ssim(X_test[rand_num].reshape(image_width, image_width), reconstructed_images[rand_num].reshape(image_width, image_width))        # plt.suptitle("MSE: %.2f, SSIM: %.2f" % (mse_img, mse_img))
+            # X_test is uint8, reconstructed images are in [0, 1]
+            original = X_test[rand_num].reshape(image_width, image_width) / 255.0
+            mse_img = self.mse(original, reconstructed_images[rand_num].reshape(image_width, image_width))
+            ssim_img = ssim(original, reconstructed_images[rand_num].reshape(image_width, image_width))        # plt.suptitle("MSE: %.2f, SSIM: %.2f" % (mse_img, mse_img))
             ax = plt.subplot(2, 10, i)
             title = ax.title.set_text("MSE: %.2f, SSIM: %.2f" % (mse_img, ssim_img))
             ax.title.set_fontsize('6')
@@ -196,14 +296,17 @@ class AutoEncoder():
 if __name__ == "__main__":
     if sys.argv[1] == "Training_AutoEncoder":
         AC = AutoEncoder()
-		# ! Think to launch preprocessing.py before so you get the advantage of data augmentation for training
-		# ! Also, it does all the preprocessing
-        data = AC.load_data("./output/output")
-        print(len(data))
-        # Split the dataset into 80% train and 20% test sets.
-        # keep random_state identical in VisuEncoding and Encoding 
-
-        normalized_train_data, normalized_test_data = AC.Prepare_input_data(data)
+		# ! Think to launch preprocessing.py before, it does all the preprocessing
+		# ! Augmentation is done during training, the dataset of Build_AutoEncoder_dataset is enough
+        # Augmented on the fly, each epoch sees new variants of the images
+        if os.path.exists("./output/dataset.npy"):
+            # Packed dataset, memory mapped: the split is the one of its index
+            frames, train_indexes, test_indexes = AC.load_packed_data("./output/dataset.npy")
+            print(len(frames))
+            train_dataset, validation_data = AC.Prepare_packed_data(frames, train_indexes, test_indexes)
+        else:
+            # png images are streamed from disk, 20% of them are used for tests
+            train_dataset, validation_data = AC.stream_data("./output/output")
 
         # Compile and train the model. Log and visualize using tensorboard
 
@@ -213,15 +316,12 @@ if __name__ == "__main__":
 
         encoder, decoder, aec = AC.AutoEncoder_model(image_width, image_height)
         
-        aec.compile(optimizer='adam', loss='binary_crossentropy')
+        aec.compile(optimizer='adam', loss=binary_crossentropy_frames)
         epochs=config.epochs
-        batch_size=config.batch_size
         
-        h = aec.fit(normalized_train_data, normalized_train_data,
+        h = aec.fit(train_dataset,
                         epochs=epochs,
-                        batch_size=batch_size,
-                        shuffle=True,
-                        validation_data=(normalized_test_data, normalized_test_data),
+                        validation_data=validation_data,
                         callbacks=[TensorBoard(log_dir='/tmp/autoencoder')])
         weight_path_encoder = get_path_to_cache("./model_cache/encoder/")
         weight_path_decoder = get_path_to_cache("./model_cache/decoder/")
@@ -251,6 +351,9 @@ if __name__ == "__main__":
             # AC = AutoEncoder()
             n_samples = 10 # Sample of images compared
             # weight_path_autoencoder = get_path_to_cache("./model_cache/autoencoder/")
+            if isinstance(validation_data, tf.data.Dataset):
+                # Only the test images, for the comparisons
+                normalized_test_data = np.concatenate([x for x, _ in validation_data.as_numpy_iterator()])
             AC.visualize("file_autoencoder_learning_curve.pk", n_samples, aec, "already_loaded", normalized_test_data)
         
         # Convergence Vizualisation later
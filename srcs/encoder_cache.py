@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import config
+
+
+def frame_key(frame):
+	"""
+		Key of a uint8 preprocessed frame: 16 bytes of blake2b of its pixels and shape
+	"""
+	h = hashlib.blake2b(np.ascontiguousarray(frame).data, digest_size=16)
+	h.update(repr(frame.shape).encode())
+	return h.digest()
+
+
+class EncoderCache():
+	def __init__(self, encode, weights_version, max_bytes=config.encoder_cache_bytes):
+		'''
+			LRU cache of the latents of the encoder, keyed by the content of the frames:
+			the static frames after env.reset() or the frames reread by --no_sim epochs are encoded once.
+
+			Args:
+				encode: function(uint8 frames of shape (N, rows, cols)) -> latents of shape (N, ...)
+				weights_version: function() -> anything identifying the encoder weights,
+					like AutoEncoder.encoder_checksum. The cache is emptied when it changes.
+				max_bytes (int, optional): size of the cached latents and keys,
+					least recently used latents are evicted above it. Defaults to config.encoder_cache_bytes.
+		'''
+		self.encode_function = encode
+		self.weights_version = weights_version
+		self.max_bytes = max_bytes
+		self.entries = OrderedDict()
+		self.nbytes = 0
+		self.version = None
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+		# Shape and dtype of a latent, known after the first encoding
+		self.latent_shape = None
+		self.latent_dtype = None
+		self.lock = threading.Lock()
+
+	def clear(self):
+		with self.lock:
+			self.empty()
+
+	def empty(self):
+		# The lock must be held
+		self.entries.clear()
+		self.nbytes = 0
+
+	def encode(self, frames):
+		'''
+			Latents of `frames`, only the frames not in the cache are given to the encoder, in one call
+
+			Returns:
+				np.ndarray: latents of shape (N, ...), in the order of `frames`
+		'''
+		if not len(frames):
+			if self.latent_shape is None:
+				return self.encode_function(frames)
+			return np.empty((0, *self.latent_shape), dtype=self.latent_dtype)
+		keys = [frame_key(frame) for frame in frames]
+		latents = [None] * len(keys)
+		# Identical frames of the batch are encoded once
+		missing = {}
+		with self.lock:
+			version = self.weights_version()
+			if version != self.version:
+				if self.entries:
+					self.invalidations += 1
+				self.empty()
+				self.version = version
+			for i, key in enumerate(keys):
+				latent = self.entries.get(key)
+				if latent is None:
+					missing.setdefault(key, []).append(i)
+				else:
+					self.entries.move_to_end(key)
+					latents[i] = latent
+			# Misses are the frames given to the encoder
+			self.hits += len(keys) - len(missing)
+			self.misses += len(missing)
+		if missing:
+			indexes = [indexes[0] for indexes in missing.values()]
+			encoded = self.encode_function(frames[indexes])
+			self.latent_shape = encoded.shape[1:]
+			self.latent_dtype = encoded.dtype
+			with self.lock:
+				# Latents of weights replaced during the encoding are returned, not cached
+				cache = version == self.version
+				for (key, same_frames), latent in zip(missing.items(), encoded):
+					# A copy, not a view keeping the whole batch alive
+					latent = latent.copy()
+					for i in same_frames:
+						latents[i] = latent
+					if cache:
+						self.add(key, latent)
+		return np.stack(latents)
+
+	def add(self, key, latent):
+		# The lock must be held
+		size = latent.nbytes + len(key)
+		if size > self.max_bytes:
+			return
+		if key in self.entries:
+			self.nbytes -= self.entries.pop(key).nbytes + len(key)
+		self.entries[key] = latent
+		self.nbytes += size
+		while self.nbytes > self.max_bytes:
+			old_key, old_latent = self.entries.popitem(last=False)
+			self.nbytes -= old_latent.nbytes + len(old_key)
+			self.evictions += 1
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {"entries": len(self.entries),
+				"bytes": self.nbytes,
+				"hits": self.hits,
+				"misses": self.misses,
+				"hit_rate": self.hits / lookups if lookups else 0.0,
+				"evictions": self.evictions,
+				"invalidations": self.invalidations}
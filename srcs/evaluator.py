@@ -0,0 +1,139 @@
+import time
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import config, cte_config
+from agents.factory import sim_actions
+from utils import upload_json_file
+from vec_rollout import SimSlot, sim_step_or_crash
+from sim_supervisor import SimCrashed
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class Evaluator():
+	def __init__(self, player, nb_episodes, nb_envs, ports=None, max_steps=config.eval_max_steps):
+		'''
+			Runs `nb_episodes` episodes of the deterministic policy of player.agent,
+			spread over `nb_envs` simulators driven in parallel, and writes their metrics in json.
+
+			An episode is completed when it reaches `max_steps` steps without going out of the road.
+			cte values are taken with cte_config.cte_offset, like is_cte_out does.
+
+			Args:
+				player (NeuralPlayer): owns the agent and the preprocessing
+				nb_episodes (int): number of episodes to evaluate
+				nb_envs (int): number of simulators
+				ports (list, optional): port of each simulator.
+					Defaults to player.args.port, player.args.port + 1, ...
+					Unused with simlaunch3000, which gives the ports itself.
+				max_steps (int, optional): Defaults to config.eval_max_steps.
+		'''
+		self.player = player
+		self.args = player.args
+		self.agent = player.agent
+		self.nb_episodes = nb_episodes
+		self.max_steps = max_steps
+		if not ports:
+			ports = [self.args.port + i for i in range(nb_envs)]
+		# No need for more simulators than episodes
+		self.sims = [SimSlot(self.args, port) for port in ports[:nb_episodes]]
+		frame_stack = self.sims[0].frame_stack
+		self.states = np.zeros((len(self.sims), *frame_stack.state_shape), dtype=frame_stack.dtype)
+		self.pool = ThreadPoolExecutor(max_workers=len(self.sims))
+		self.episodes = []
+		self.started = 0
+
+	def start_episode(self, sim):
+		try:
+			self.reset(sim)
+		except SimCrashed as crash:
+			sim.restart(crash, self.reset)
+		self.started += 1
+
+	def reset(self, sim):
+		sim.preprocessed_state = self.player.prepare_state(sim.supervisor.reset(), new_episode=True, frame_stack=sim.frame_stack)
+		sim.episode_len = 0
+		sim.abs_cte = []
+		sim.start = time.time()
+
+	def end_episode(self, sim, completed):
+		elapsed = time.time() - sim.start
+		episode = {"port": sim.args.port,
+					"episode_len": sim.episode_len,
+					"mean_abs_cte": float(np.mean(sim.abs_cte)),
+					"max_abs_cte": float(np.max(sim.abs_cte)),
+					"steps_per_second": sim.episode_len / elapsed,
+					"completed": completed}
+		logger.info("evaluation episode: %s %s", len(self.episodes), episode)
+		self.episodes.append(episode)
+
+	def run(self):
+		try:
+			start = time.time()
+			active = list(self.sims)
+			for sim in active:
+				self.start_episode(sim)
+			while active:
+				for i, sim in enumerate(active):
+					self.states[i] = sim.preprocessed_state[0]
+				actions = sim_actions(self.args.agent,
+									self.agent,
+									self.states[:len(active)],
+									self.args.throttle,
+									deterministic=True)
+				results = self.pool.map(sim_step_or_crash,
+										[self.player] * len(active),
+										actions,
+										active)
+				still_active = []
+				for sim, result in zip(active, results):
+					if isinstance(result, SimCrashed):
+						# The crashed episode is not evaluated, it is played again on the new simulator
+						logger.warning("evaluation episode on port %s dropped: %s", sim.args.port, result)
+						sim.restart(result, self.reset)
+						still_active.append(sim)
+						continue
+					new_state, reward, done, info = result
+					sim.episode_len = sim.episode_len + 1
+					sim.abs_cte.append(abs(info['cte'] + cte_config.cte_offset))
+					completed = not done and sim.episode_len >= self.max_steps
+					if done or completed:
+						self.end_episode(sim, completed)
+						if self.started < self.nb_episodes:
+							self.start_episode(sim)
+							still_active.append(sim)
+					else:
+						sim.preprocessed_state = self.player.prepare_state(new_state, frame_stack=sim.frame_stack)
+						still_active.append(sim)
+				active = still_active
+			self.report(time.time() - start)
+		finally:
+			self.close()
+
+	def report(self, elapsed):
+		lens = np.array([e["episode_len"] for e in self.episodes])
+		summary = {"episodes": len(self.episodes),
+					"simulators": len(self.sims),
+					"mean_episode_len": float(lens.mean()),
+					"mean_abs_cte": float(np.mean([e["mean_abs_cte"] for e in self.episodes])),
+					"max_abs_cte": float(np.max([e["max_abs_cte"] for e in self.episodes])),
+					"steps_per_second": float(lens.sum() / elapsed),
+					"completion_rate": float(np.mean([e["completed"] for e in self.episodes]))}
+		logger.info("evaluation summary: %s", summary)
+		date = datetime.now().strftime("%d_%m_%Hh%Mm")
+		file_name = f"{config.local_memory_folder}/{config.name_neural_player}_{date}{config.eval_sufix}"
+		upload_json_file(file_name, {"model": self.args.model,
+									"agent": self.args.agent,
+									"env_name": self.args.env_name,
+									"summary": summary,
+									"episodes": self.episodes})
+		logger.info("evaluation saved in %s", file_name)
+
+	def close(self):
+		self.pool.shutdown(wait=False)
+		for sim in self.sims:
+			if sim.args.sim == "simlaunch3000":
+				sim.client.kill_sim()
+			sim.env.unwrapped.close()
@@ -0,0 +1,75 @@
+import numpy as np
+from config import config
+
+
+class FrameStack():
+	def __init__(self,
+					frame_shape: tuple = None,
+					stack_size: int = None,
+					dtype=np.uint8):
+		"""
+			Preallocated circular stack of the last `stack_size` frames.
+
+			Every frame is written twice, at `index` and `index + stack_size`,
+			so the window buffer[..., index:index + stack_size] is always the
+			full stack, newest frame first, without any copy or concatenation.
+
+			Args:
+				frame_shape (tuple, optional): shape of one preprocessed frame.
+					Defaults to (config.prep_img_rows, config.prep_img_cols).
+				stack_size (int, optional): number of frames in a state.
+					Defaults to config.prep_img_channels.
+				dtype (optional): dtype of the frames. Defaults to np.uint8.
+		"""
+		if not frame_shape:
+			frame_shape = (config.prep_img_rows, config.prep_img_cols)
+		if not stack_size:
+			stack_size = config.prep_img_channels
+		self.frame_shape = tuple(frame_shape)
+		self.stack_size = stack_size
+		self.dtype = dtype
+		# Shape of a state, without the batch dimension
+		self.state_shape = (*self.frame_shape, stack_size)
+		# Leading 1 is the batch dimension expected by the agents
+		self.buffer = np.zeros((1, *self.frame_shape, 2 * stack_size), dtype=dtype)
+		self.index = 0
+
+	def reset(self, frame: np.ndarray) -> np.ndarray:
+		"""Fill the whole stack with `frame`, for the 1st frame of an episode"""
+		self.buffer[0] = np.expand_dims(frame, axis=-1)
+		self.index = 0
+		return self.view()
+
+	def push(self, frame: np.ndarray) -> np.ndarray:
+		"""Add `frame` as newest frame, the oldest one is dropped"""
+		self.index = (self.index - 1) % self.stack_size
+		self.buffer[0, ..., self.index] = frame
+		self.buffer[0, ..., self.index + self.stack_size] = frame
+		return self.view()
+
+	def view(self) -> np.ndarray:
+		"""
+			Returns:
+				A view of shape (1, *frame_shape, stack_size) on the buffer.
+				It is only valid until the next push(), use snapshot() to keep it.
+		"""
+		return self.buffer[..., self.index:self.index + self.stack_size]
+
+	def snapshot(self) -> np.ndarray:
+		"""Returns a copy of the current stack, safe to store in the replay memory"""
+		return self.view().copy()
+
+
+def create_frame_stack(latent=False):
+	"""
+		Frame stack of the states given to the agents, as set by args.latent
+
+		Args:
+			latent (bool, optional): stack the encoder output of each frame,
+				of shape (config.encoder_output_shape,), instead of the frames. Defaults to False.
+	"""
+	if latent:
+		return FrameStack(frame_shape=config.latent_shape[:-1],
+							stack_size=config.latent_shape[-1],
+							dtype=np.float32)
+	return FrameStack()
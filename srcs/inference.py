@@ -0,0 +1,44 @@
+import time
+import numpy as np
+import tensorflow as tf
+
+
+class CompiledModel():
+	def __init__(self, model):
+		'''
+			Inference of a Keras model through a tf.function traced once, with a fixed input signature.
+			model.predict builds a data adapter and loops over batches at each call,
+			an eager call runs the layers op by op from python: for a single frame
+			both cost more than the model itself.
+			The batch size is not fixed, the same trace serves single frames and batches.
+			The weights are the variables of the model: training, set_weights and load_weights are seen.
+
+			Args:
+				model (keras.Model): with a single input
+		'''
+		self.model = model
+		dtype = tf.as_dtype(model.inputs[0].dtype)
+		self.numpy_dtype = dtype.as_numpy_dtype
+		self.input_spec = tf.TensorSpec((None, *model.input_shape[1:]), dtype)
+		self.function = tf.function(self.call, input_signature=[self.input_spec])
+
+	def call(self, inputs):
+		return self.model(inputs, training=False)
+
+	def __call__(self, inputs):
+		'''
+			Returns:
+				The output tensors of the model for `inputs`, of any batch size
+		'''
+		return self.function(np.asarray(inputs, dtype=self.numpy_dtype))
+
+	def warm_up(self):
+		'''
+			Traces the function with a batch of 1 zero state, so that the first real call is not slow
+
+			Returns:
+				float: duration of the warm-up, in seconds
+		'''
+		start = time.perf_counter()
+		self(np.zeros((1, *self.input_spec.shape[1:]), dtype=self.numpy_dtype))
+		return time.perf_counter() - start
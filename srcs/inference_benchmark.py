@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import argparse
+import platform
+from datetime import datetime
+import numpy as np
+import tensorflow as tf
+from config import config
+from encodDecod import AutoEncoder
+from agents.factory import create_agent
+from inference import CompiledModel
+from utils import upload_json_file
+from logs import setup_logging
+
+
+def models():
+	"""
+		Returns:
+			dict: name -> keras model called for each frame in the driving loops
+	"""
+	encoder, _, _ = AutoEncoder().AutoEncoder_model(config.img_rows, config.img_cols)
+	available = {"encoder": encoder}
+	for latent in (False, True):
+		suffix = "_latent" if latent else ""
+		available[f"ddqn{suffix}"] = create_agent("DDQN", train=False, latent=latent).model
+		available[f"sac_policy{suffix}"] = create_agent("SAC", train=False, latent=latent).policy.actor_network
+	return available
+
+
+def paths(model):
+	"""
+		Returns:
+			dict: name -> function(input batch), the ways of running `model`
+	"""
+	compiled = CompiledModel(model)
+	return {"predict": lambda x: model.predict(x),
+			"eager": lambda x: model(x, training=False),
+			"compiled": compiled}
+
+
+def measure(run, inputs, calls):
+	# Warm-up, not measured: traces the compiled path
+	run(inputs)
+	latencies = np.empty(calls)
+	for i in range(calls):
+		begin = time.perf_counter()
+		# The outputs are read, like the driving loops do
+		tf.nest.map_structure(np.asarray, run(inputs))
+		latencies[i] = time.perf_counter() - begin
+	latencies *= 1e6
+	return {"mean_us": float(latencies.mean()),
+			"p50_us": float(np.percentile(latencies, 50)),
+			"p95_us": float(np.percentile(latencies, 95))}
+
+
+def run_benchmark(calls):
+	results = []
+	for name, model in models().items():
+		spec = CompiledModel(model).input_spec
+		rng = np.random.default_rng(0)
+		inputs = rng.integers(0, 256, (1, *spec.shape[1:])).astype(spec.dtype.as_numpy_dtype)
+		reference = None
+		for path, run in paths(model).items():
+			result = measure(run, inputs, calls)
+			outputs = [np.asarray(o) for o in tf.nest.flatten(run(inputs))]
+			if reference is None:
+				reference = outputs
+			result.update({"model": name,
+							"path": path,
+							"batch_size": 1,
+							"max_abs_diff": float(max(np.abs(o - r).max() for o, r in zip(outputs, reference)))})
+			print(f"{name:<18} {path:<9} {result['mean_us']:10.1f} us/call | p50 {result['p50_us']:10.1f} | "
+				f"p95 {result['p95_us']:10.1f} | max abs diff with predict: {result['max_abs_diff']:.2g}")
+			results.append(result)
+	return results
+
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description='Benchmark of the single frame inference of the encoder and the agents')
+	parser.add_argument('--calls', type=int, default=500,
+						help='Number of measured calls of each model and path')
+	parser.add_argument('--gpu', action="store_true",
+						help='Keep the GPUs visible, the benchmark runs on CPU by default')
+	parser.add_argument('--output', type=str, default=None,
+						help='json file of the results, defaults to local_memory/inference_<date>_benchmark.json')
+	return parser.parse_args()
+
+
+if __name__ == "__main__":
+	args = parse_arguments()
+	setup_logging()
+	if not args.gpu:
+		# Before any tensorflow operation
+		tf.config.set_visible_devices([], "GPU")
+	results = run_benchmark(args.calls)
+	file_name = args.output
+	if not file_name:
+		date = datetime.now().strftime("%d_%m_%Hh%Mm")
+		file_name = f"{config.local_memory_folder}/inference_{date}{config.benchmark_sufix}"
+	upload_json_file(file_name, {"date": datetime.now().isoformat(),
+								"machine": {"platform": platform.platform(),
+											"python": sys.version.split()[0],
+											"cpus": os.cpu_count(),
+											"gpus": len(tf.config.list_physical_devices("GPU"))},
+								"versions": {"tensorflow": tf.__version__,
+											"numpy": np.__version__},
+								"calls": args.calls,
+								"results": results})
+	print(f"Benchmark saved in {file_name}")
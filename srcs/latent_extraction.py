@@ -0,0 +1,101 @@
+import os
+import glob
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+from tqdm import tqdm
+from config import config
+from utils import read_pickle_file
+from utils_get_abs_path import get_path_to_cache
+from offline_trainer import episode_frames, latents_path, read_latents
+from preprocessing import Preprocessing
+from encodDecod import AutoEncoder, weights_checksum
+from logs import setup_logging
+
+
+def init_worker(weight_path, threads):
+	global worker_preprocessing, worker_encoder
+	# Spawned workers do not run the __main__ block
+	setup_logging()
+	import tensorflow as tf
+	# The workers share the cpus instead of each one using all of them
+	tf.config.threading.set_intra_op_parallelism_threads(threads)
+	tf.config.threading.set_inter_op_parallelism_threads(1)
+	worker_preprocessing = Preprocessing()
+	AC = AutoEncoder()
+	encoder, _, _ = AC.AutoEncoder_model(config.img_rows, config.img_cols)
+	worker_encoder = AC.Loaded_Encoder(weight_path, encoder)
+
+
+def extract_episode(job):
+	"""
+		Work of a worker: preprocesses and encodes all the frames of an episode,
+		like OfflineTrainer.preprocess_frames, and writes them next to it
+
+		Returns:
+			int: number of frames encoded
+	"""
+	episode_file, checksum = job
+	db, frames = episode_frames(read_pickle_file(episode_file))
+	if not db:
+		return 0
+	# Cropped like the training frames of the encoder
+	frames = worker_preprocessing.process_images(np.stack(frames), crop=config.encoder_crop)
+	latents = worker_encoder.predict(frames[..., np.newaxis], batch_size=config.latent_batch_size)
+	path = latents_path(episode_file)
+	# Written then renamed: an interrupted job leaves no truncated latents
+	with open(path + ".tmp", "wb") as f:
+		np.savez(f, latents=latents.astype(np.float16), encoder_checksum=np.array(checksum),
+				crop=np.array(config.encoder_crop))
+	os.replace(path + ".tmp", path)
+	return len(latents)
+
+
+def extract_latents(prefix, weight_path="", workers=config.latent_workers, force=False):
+	"""
+		Encodes the episodes recorded with --save under `prefix` (the --no_sim argument)
+		by `workers` processes, so that --no_sim --offline --latent trainings load the latents directly.
+		The latents are float16, tagged with the checksum of the encoder weights:
+		episodes already extracted with the same weights are skipped, unless `force`.
+
+		Returns:
+			int: number of frames encoded
+	"""
+	if not weight_path:
+		weight_path = get_path_to_cache("model_cache/encoder/encoder_weights")
+	checksum = weights_checksum(weight_path)
+	files = sorted(glob.glob(f"{prefix}_*{config.memory_sufix}"))
+	jobs = [(f, checksum) for f in files if force or read_latents(f, checksum) is None]
+	print(f"{len(jobs)}/{len(files)} episodes to encode with the encoder {checksum}")
+	if not jobs:
+		return 0
+	workers = min(workers, len(jobs))
+	threads = max(1, os.cpu_count() // workers)
+	start = time.time()
+	encoded = 0
+	with mp.get_context("spawn").Pool(workers, initializer=init_worker, initargs=(weight_path, threads)) as pool:
+		for nb_frames in tqdm(pool.imap_unordered(extract_episode, jobs), total=len(jobs), unit="episode"):
+			encoded += nb_frames
+	elapsed = time.time() - start
+	print(f"{encoded} frames encoded: {encoded / max(elapsed, 1e-9):.1f} frames/s")
+	return encoded
+
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description='Encode the frames of the recorded episodes once for offline trainings')
+	parser.add_argument('prefix', type=str,
+						help='Prefix of the episodes, like the --no_sim argument')
+	parser.add_argument('--weights', type=str, default="",
+						help='Encoder weights, defaults to those of AutoEncoder.Loaded_Encoder')
+	parser.add_argument('--workers', type=int, default=config.latent_workers,
+						help='Number of worker processes')
+	parser.add_argument('--force', action="store_true",
+						help='Encode again the episodes already encoded with the same weights')
+	return parser.parse_args()
+
+
+if __name__ == "__main__":
+	args = parse_arguments()
+	setup_logging()
+	extract_latents(args.prefix, args.weights, args.workers, args.force)
@@ -0,0 +1,58 @@
+import sys
+import time
+import logging
+from config import config
+
+# Pass as extra= for messages of the driving loop, they are rate limited
+HOT = {"hot": True}
+
+
+class RateLimitFilter(logging.Filter):
+	def __init__(self, interval=config.log_interval):
+		'''
+			Lets at most one hot message by `interval` seconds through, for each message template.
+			The number of suppressed messages is added to the next one let through.
+		'''
+		super().__init__()
+		self.interval = interval
+		self.last = {}
+		self.suppressed = {}
+
+	def filter(self, record):
+		if not getattr(record, "hot", False):
+			return True
+		key = (record.name, record.msg)
+		now = time.monotonic()
+		if key in self.last and now - self.last[key] < self.interval:
+			self.suppressed[key] = self.suppressed.get(key, 0) + 1
+			return False
+		self.last[key] = now
+		suppressed = self.suppressed.pop(key, 0)
+		if suppressed:
+			record.msg = f"{record.msg} (+{suppressed} suppressed)"
+		return True
+
+
+def setup_logging(level=config.log_level, interval=config.log_interval):
+	'''
+		Configures the loggers of get_logger(), must be called once by process
+	'''
+	handler = logging.StreamHandler(sys.stdout)
+	handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+	if interval:
+		handler.addFilter(RateLimitFilter(interval))
+	root = logging.getLogger("patate")
+	root.handlers = [handler]
+	root.setLevel(level)
+	# simlaunch3000 configures the root logger for its own file
+	root.propagate = False
+
+
+def get_logger(name):
+	'''
+		Usage:
+			logger = get_logger(__name__)
+			logger.debug("shape: %s", x.shape, extra=HOT)
+		Arguments are only formatted if the message is emitted.
+	'''
+	return logging.getLogger(f"patate.{name}")
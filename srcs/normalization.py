@@ -0,0 +1,41 @@
+import tensorflow as tf
+from tensorflow.keras import layers
+
+
+class ScaleFrames(layers.Layer):
+	"""
+		First layer of the models fed with uint8 frames: scales them in [0, 1] on the device,
+		so frames stay uint8 in the replay memory, the datasets and the copies to the model.
+
+		Args:
+			scale (bool, optional): False only casts the frames, kept in [0, 255]
+				like the agents trained before this layer existed expect them. Defaults to True.
+	"""
+	def __init__(self, scale=True, **kwargs):
+		super().__init__(**kwargs)
+		self.scale = scale
+
+	def call(self, inputs):
+		inputs = tf.cast(inputs, self.compute_dtype)
+		if self.scale:
+			return inputs / 255.0
+		return inputs
+
+	def get_config(self):
+		return {**super().get_config(), "scale": self.scale}
+
+
+def frames_input(shape, scale=True):
+	"""
+		Input of a model fed with `shape` states, and the tensor to build the model on.
+		Stacks of frames (rows, cols, channels) are uint8 and scaled by ScaleFrames (see its `scale`),
+		other states (stacks of latents) are float32 and used as they are.
+
+		Returns:
+			(inputs, tensor)
+	"""
+	if len(shape) != 3:
+		inputs = layers.Input(shape=shape)
+		return inputs, inputs
+	inputs = layers.Input(shape=shape, dtype=tf.uint8)
+	return inputs, ScaleFrames(scale)(inputs)
@@ -0,0 +1,163 @@
+import os
+import time
+import numpy as np
+from config import config
+from utils import read_pickle_file
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+def stack_frames(frames, stack_size=config.prep_img_channels):
+	"""
+		Frame stacking of a whole episode at once
+
+		Args:
+			frames (np.ndarray): preprocessed frames of the episode, of shape (T, rows, cols),
+				or their latents of shape (T, config.encoder_output_shape)
+
+		Returns:
+			np.ndarray: of shape (T, rows, cols, stack_size), stack t is [frame t, frame t - 1, ...],
+				the 1st frame being repeated like in NeuralPlayer.prepare_state
+	"""
+	steps = np.arange(len(frames))
+	indexes = np.maximum(steps[:, None] - np.arange(stack_size)[None, :], 0)
+	return np.moveaxis(frames[indexes], 1, -1)
+
+
+def episode_frames(db):
+	"""
+		Transitions of a recorded episode used for training, and the raw frames of their states:
+		frame t is the state of transition t, frame t + 1 its new state
+
+		Returns:
+			(transitions, frames)
+	"""
+	# Transitions recorded before the first action of a HumanPlayer are useless
+	db = [transition for transition in db if transition[1] is not None]
+	if not db:
+		return db, []
+	# The state of a transition is the new state of the previous one
+	return db, [db[0][0]] + [transition[3] for transition in db]
+
+
+def latents_path(episode_file):
+	"""
+		Latents of an episode written by latent_extraction.py: ./local_memory/X_0.pkl -> ./local_memory/X_0_latents.npz
+	"""
+	return os.path.splitext(episode_file)[0] + config.latent_sufix
+
+
+def read_latents(episode_file, checksum):
+	"""
+		Returns:
+			np.ndarray: the float16 latents of the frames of episode_frames,
+				None when they were not extracted, not by the encoder of `checksum`
+				or not from frames cropped according to config.encoder_crop
+	"""
+	path = latents_path(episode_file)
+	if not os.path.exists(path):
+		return None
+	with np.load(path) as stored:
+		if str(stored["encoder_checksum"]) != checksum:
+			return None
+		# Latents extracted before the crop was recorded are from uncropped frames
+		if "crop" not in stored or bool(stored["crop"]) != config.encoder_crop:
+			return None
+		return stored["latents"]
+
+
+class OfflineTrainer():
+	def __init__(self, player, epochs=config.offline_epochs):
+		'''
+			Trains player.agent on the episodes recorded with --save,
+			named like NeuralPlayer.get_db_from_file expects them.
+			Episodes are loaded and preprocessed once, then the agent is trained on
+			shuffled minibatches for `epochs` epochs, without simulating any step.
+
+			Args:
+				player (NeuralPlayer): owns the agent, the preprocessing and args.no_sim
+				epochs (int, optional): Defaults to config.offline_epochs.
+		'''
+		self.player = player
+		self.agent = player.agent
+		self.epochs = epochs
+		self.states = None
+		self.actions = None
+		self.rewards = None
+		self.new_states = None
+		self.dones = None
+
+	def preprocess_frames(self, frames):
+		# Frames given to the encoder are cropped like its training frames
+		crop = self.player.args.latent and config.encoder_crop
+		frames = self.player.preprocessing.process_images(np.stack(frames), crop=crop)
+		if self.player.args.latent:
+			# A whole episode in one call of the encoder
+			return self.player.encode_frames(frames)
+		return frames
+
+	def load_episode(self, db, latents=None):
+		"""
+			Args:
+				latents (np.ndarray, optional): latents extracted by latent_extraction.py,
+					the frames are then neither preprocessed nor encoded
+		"""
+		db, frames = episode_frames(db)
+		if not db:
+			return None
+		if latents is None:
+			features = self.preprocess_frames(frames)
+		else:
+			features = latents.astype(np.float32)
+		stacks = stack_frames(features)
+		_, actions, rewards, _, dones, _ = zip(*db)
+		dones = np.array(dones, dtype=bool)
+		rewards = np.array([self.player.reward_optimization(r, d) for r, d in zip(rewards, dones)])
+		return stacks[:-1], np.array(actions, dtype=np.float32), rewards, stacks[1:], dones
+
+	def load(self):
+		episodes = []
+		e = 0
+		extracted = 0
+		start = time.time()
+		while True:
+			file_name = f"{self.player.args.no_sim}_{e}{config.memory_sufix}"
+			if not os.path.exists(file_name):
+				break
+			latents = None
+			if self.player.args.latent:
+				latents = read_latents(file_name, self.player.AC.encoder_checksum)
+				extracted += latents is not None
+			episode = self.load_episode(read_pickle_file(file_name), latents)
+			if episode:
+				episodes.append(episode)
+			e += 1
+		if not episodes:
+			logger.info("No episode found for %s", self.player.args.no_sim)
+			return False
+		self.states, self.actions, self.rewards, self.new_states, self.dones = [np.concatenate(x) for x in zip(*episodes)]
+		logger.info("Loaded %s transitions from %s episodes (%s with extracted latents) in %.1fs",
+					len(self.states), e, extracted, time.time() - start)
+		return True
+
+	def run(self):
+		if not self.load():
+			return
+		batch_size = self.agent.batch_size
+		nb_batches = len(self.states) // batch_size
+		for epoch in range(self.epochs):
+			start = time.time()
+			order = np.random.permutation(len(self.states))
+			for b in range(nb_batches):
+				batch = order[b * batch_size:(b + 1) * batch_size]
+				self.agent.train_on_batch(self.states[batch],
+										self.actions[batch],
+										self.rewards[batch],
+										self.new_states[batch],
+										self.dones[batch])
+			# Every epoch update the target model to be same with model
+			self.agent.update_target_model()
+			self.player.checkpoints.maybe_save(epoch)
+			elapsed = time.time() - start
+			logger.info("epoch: %s batches: %s transitions/s: %10.2f", epoch, nb_batches, nb_batches * batch_size / elapsed)
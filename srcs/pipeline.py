@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class ActionPipeline():
+	def __init__(self, choose):
+		'''
+			Computes the next action on a worker thread while the simulator runs the current one.
+			Actions are sent to the simulator with one step of latency:
+			the action done at step t was chosen from the state of step t - 1.
+
+			Args:
+				choose (function): state -> action sent to the simulator
+		'''
+		self.choose = choose
+		self.pool = ThreadPoolExecutor(max_workers=1)
+		self.future = None
+
+	def next_action(self, state):
+		'''
+			Returns the action to do now and starts choosing the next one from `state`
+		'''
+		if self.future is None:
+			# 1st step of an episode: nothing was computed in advance.
+			# The action chosen from `state` is also the next one, `state` is not given twice to the agent
+			action = self.choose(state)
+			self.future = Future()
+			self.future.set_result(action)
+			return action
+		action = self.future.result()
+		self.future = self.pool.submit(self.choose, state)
+		return action
+
+	def reset(self):
+		'''
+			Drops the pending action, must be called when an episode ends
+		'''
+		if self.future is not None:
+			self.future.result()
+			self.future = None
+
+	def close(self):
+		self.reset()
+		self.pool.shutdown()
@@ -7,7 +7,9 @@ from numpy.core.numerictypes import obj2sctype
 from config import config
 from PIL import Image, ImageOps
 import sys
+import time
 import shutil
+import multiprocessing as mp
 # Token for Qarnot
 # from config.env import keys
 import sklearn
@@ -17,7 +19,42 @@ from tqdm import tqdm
 import Augmentor
 
 # from encodDecod import encod_model
-from encodDecod import AutoEncoder
+from encodDecod import AutoEncoder, is_test_file, dataset_index_path
+from utils import upload_json_file
+
+# Weights of ImageOps.grayscale: L = R * 299/1000 + G * 587/1000 + B * 114/1000
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+# Bigger batches are processed by chunks: their float temporaries stay in cache
+PROCESS_CHUNK = 16
+# Rows and columns kept by Image_crop
+CROP_ROWS = slice(40, 120)
+CROP_COLS = slice(1, None)
+
+
+def lanczos(x, a=3):
+	return np.sinc(x) * np.sinc(x / a) * (np.abs(x) < a)
+
+
+def resample_matrix(in_size, out_size):
+	"""
+		Weights of the Lanczos resampling done by PIL (Image.ANTIALIAS) along one axis
+
+		Returns:
+			np.ndarray: of shape (out_size, in_size), each row sums to 1
+	"""
+	scale = in_size / out_size
+	# When downsampling, the filter is stretched so that it also antialiases
+	filter_scale = max(scale, 1.0)
+	support = 3 * filter_scale
+	weights = np.zeros((out_size, in_size), dtype=np.float64)
+	for i in range(out_size):
+		center = (i + 0.5) * scale
+		x_min = max(int(center - support + 0.5), 0)
+		x_max = min(int(center + support + 0.5), in_size)
+		w = lanczos((np.arange(x_min, x_max) - center + 0.5) / filter_scale)
+		weights[i, x_min:x_max] = w / w.sum()
+	return weights.astype(np.float32)
+
 
 class Preprocessing():
 	def __init__(self, input_shape: tuple = None, output_shape: tuple = None):
@@ -32,6 +69,28 @@ class Preprocessing():
 								config.prep_img_cols)
 		else:
 			self.output_shape = output_shape
+		# Shapes are fixed for a run: the operators of process_images are built once
+		self.operators = {crop: self.resize_operator(crop) for crop in (False, True)}
+
+	def resize_operator(self, crop: bool = False):
+		"""Separable matrices doing the crop and the resize of process_images
+
+		The cropped pixels get null weights, so cropping costs nothing more.
+
+		Returns:
+			(rows, cols): of shapes (output rows, input rows) and (input cols, output cols),
+				gray frame -> rows @ frame @ cols
+		"""
+		in_rows, in_cols, _ = self.input_shape
+		kept_rows = slice(None)
+		kept_cols = slice(None)
+		if crop:
+			kept_rows, kept_cols = CROP_ROWS, CROP_COLS
+		rows = np.zeros((self.output_shape[0], in_rows), dtype=np.float32)
+		rows[:, kept_rows] = resample_matrix(len(range(in_rows)[kept_rows]), self.output_shape[0])
+		cols = np.zeros((self.output_shape[1], in_cols), dtype=np.float32)
+		cols[:, kept_cols] = resample_matrix(len(range(in_cols)[kept_cols]), self.output_shape[1])
+		return rows, np.ascontiguousarray(cols.T)
 
 	def Image_crop(self, Im):
 		""" 		
@@ -51,7 +110,8 @@ class Preprocessing():
 	def Image_resize(self, Im):
 		""" Resize to obtain a square matrix """
 		# config.img_rows, config.img_cols = 64, 64 for remind
-		img_resize = Im.resize((config.img_rows, config.img_cols), Image.ANTIALIAS)
+		# ANTIALIAS is the former name of LANCZOS, removed from Pillow 10
+		img_resize = Im.resize((config.img_rows, config.img_cols), getattr(Image, "ANTIALIAS", Image.LANCZOS))
 		return img_resize
 	
 	def rgb2gray(self, Im):
@@ -61,11 +121,14 @@ class Preprocessing():
 		return ImageOps.grayscale(Im)
 		
 	def EncodedImage(self, gray_image, encoder):
-		# Image Normalization
-		normalized_im = np.array(gray_image).astype('float32')/255.0
-		normalized_im = np.expand_dims(normalized_im,axis=0)
-		# Encode image with the parameter encoder
-		encode_im = encoder.predict(normalized_im)
+		"""
+			Args:
+				encoder (CompiledModel): compiled inference of the encoder, see NeuralPlayer.encoder_inference
+		"""
+		# The encoder normalizes the uint8 image itself
+		im = np.expand_dims(np.array(gray_image), axis=(0, -1))
+		# Encode image with the parameter encoder, predict costs more than the encoder itself for a single image
+		encode_im = encoder(im).numpy()
 		return encode_im
 
 	def process_image(self, obs: np.ndarray) -> np.ndarray:
@@ -85,6 +148,84 @@ class Preprocessing():
 		# print("obs_cv2", obs.shape)
 		return obs
 
+	def process_images(self, frames: np.ndarray, crop: bool = False) -> np.ndarray:
+		"""Array version of process_image, for a whole batch of frames and without PIL
+
+		Frames are converted to grayscale and resized with the Lanczos weights of PIL,
+		results differ from process_image by a few gray levels, as PIL rounds and clips between its passes:
+		at most 1 on smooth frames. On pure noise, most frames differ by at most 3 or 4,
+		and about 1 pixel in 30000 by 5 to 8.
+		The crop and the resize are done by the two products of self.operators.
+
+		Args:
+			frames: uint8 frames of shape (N, *self.input_shape)
+			crop: remove the sky first, like Image_crop. Defaults to False.
+
+		Returns:
+			uint8 frames of shape (N, *self.output_shape)
+		"""
+		frames = np.asarray(frames)
+		if frames.shape[1:] != tuple(self.input_shape):
+			raise ValueError(f"Frames of shape {frames.shape[1:]} given, expected {tuple(self.input_shape)}")
+		if not len(frames):
+			return np.empty((0, *self.output_shape), dtype=np.uint8)
+		if len(frames) > PROCESS_CHUNK:
+			processed = np.empty((len(frames), *self.output_shape), dtype=np.uint8)
+			for i in range(0, len(frames), PROCESS_CHUNK):
+				processed[i:i + PROCESS_CHUNK] = self.process_images(frames[i:i + PROCESS_CHUNK], crop=crop)
+			return processed
+		rows, cols = self.operators[crop]
+		in_rows, in_cols, channels = self.input_shape
+		gray = frames.reshape(-1, channels) @ GRAY_WEIGHTS[:channels]
+		# Columns first, as one product for the whole batch: (N * H, W) @ (W, cols)
+		resized = gray.reshape(-1, in_cols) @ cols
+		resized = rows @ resized.reshape(len(frames), in_rows, -1)
+		return np.clip(np.rint(resized), 0, 255).astype(np.uint8)
+
+	def process_frame(self, frame: np.ndarray, crop: bool = False) -> np.ndarray:
+		"""process_images for a single frame of shape self.input_shape, for the driving loops"""
+		return self.process_images(frame[np.newaxis], crop=crop)[0]
+
+	def build_dataset(self, input_path, output_file, workers=config.prep_workers, chunk_size=config.prep_chunk_size):
+		"""Parallel version of the preprocessing of preproc_AutoEncoder, without augmentation
+
+		The png images found under `input_path` are preprocessed by `workers` processes,
+		`chunk_size` images at a time, and streamed in a single uint8 .npy file of shape
+		(number of images, *self.output_shape), in the order of the sorted file names.
+		Images already preprocessed (like the ones of preproc_AutoEncoder) are packed as they are.
+		The sidecar index (see dataset_index_path) has the source file of each image
+		and its split, the one of AutoEncoder.stream_data.
+
+		Returns:
+			int: number of images written
+		"""
+		paths = sorted(os.path.join(root, name)
+						for root, _, names in os.walk(input_path)
+						for name in names if name.endswith('.png'))
+		chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+		# Written as the chunks arrive: the whole dataset is never in memory
+		dataset = np.lib.format.open_memmap(output_file, mode="w+", dtype=np.uint8,
+											shape=(len(paths), *self.output_shape))
+		start = time.time()
+		written = 0
+		with mp.get_context("spawn").Pool(workers, initializer=init_worker) as pool:
+			with tqdm(total=len(paths), unit="img") as progress:
+				for frames in pool.imap(process_files, chunks):
+					dataset[written:written + len(frames)] = frames
+					written += len(frames)
+					progress.update(len(frames))
+		dataset.flush()
+		del dataset
+		files = [os.path.relpath(path, input_path) for path in paths]
+		upload_json_file(dataset_index_path(output_file),
+						{"shape": [written, *self.output_shape],
+						"dtype": "uint8",
+						"files": files,
+						"split": ["test" if is_test_file(os.path.basename(f)) else "train" for f in files]})
+		elapsed = time.time() - start
+		print(f"{written} images written in {output_file}: {written / max(elapsed, 1e-9):.1f} images/s")
+		return written
+
 	def create_augmentor_pipeline(self, dir_path):
 		""" Creates a pipeline for generating extra images from images at folder `dir_path`."""
 		p = Augmentor.Pipeline(dir_path)
@@ -104,7 +245,7 @@ class Preprocessing():
 			for name in img:
 				if '.png' in name:
 					img = Image.open(Input_path + '/' + name)
-					obs = self.Image_crop(img)
+					obs = self.Image_crop(img) if config.encoder_crop else img
 					obs = self.Image_resize(obs)
 					obs = self.rgb2gray(obs)
 					name_wo_ext, ext = name.split('.') # Format image de sortie : jpg
@@ -117,7 +258,47 @@ class Preprocessing():
 		p.sample(num_samples)
 
 
+# Preprocessing of a dataset builder worker process
+worker_preprocessing = None
+
+
+def init_worker():
+	global worker_preprocessing
+	worker_preprocessing = Preprocessing()
+
+
+def process_files(paths):
+	"""
+		Work of a dataset builder worker: loads the images of `paths`,
+		crops, grays and resizes them like preproc_AutoEncoder
+
+		Returns:
+			np.ndarray: uint8 frames of shape (len(paths), *output_shape)
+	"""
+	images = [Image.open(path) for path in paths]
+	rows, cols = worker_preprocessing.output_shape[:2]
+	if all(image.size == (cols, rows) for image in images):
+		# Already preprocessed
+		return np.stack([np.asarray(image.convert("L")) for image in images])
+	frames = [np.asarray(image.convert("RGB")) for image in images]
+	if all(frame.shape == tuple(worker_preprocessing.input_shape) for frame in frames):
+		return worker_preprocessing.process_images(np.stack(frames), crop=config.encoder_crop)
+	# Images not coming from the simulator: same steps as preproc_AutoEncoder
+	P = worker_preprocessing
+	images = [Image.fromarray(frame) for frame in frames]
+	if config.encoder_crop:
+		images = [P.Image_crop(image) for image in images]
+	return np.stack([np.asarray(P.rgb2gray(P.Image_resize(image))) for image in images])
+
+
 if __name__ == "__main__":
 	if sys.argv[1] == "Preprocessing_AutoEncoder":
 		Preproc = Preprocessing()
-		Preproc.preproc_AutoEncoder("./task", "./output")
\ No newline at end of file
+		Preproc.preproc_AutoEncoder("./task", "./output")
+	if sys.argv[1] == "Build_AutoEncoder_dataset":
+		Preproc = Preprocessing()
+		Preproc.build_dataset("./task", "./output/dataset.npy")
+	if sys.argv[1] == "Pack_AutoEncoder_dataset":
+		# Packs the images already written by Preprocessing_AutoEncoder
+		Preproc = Preprocessing()
+		Preproc.build_dataset("./output/output", "./output/dataset.npy")
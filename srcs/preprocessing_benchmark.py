@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+import argparse
+import platform
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from config import config
+from preprocessing import Preprocessing, CROP_ROWS, CROP_COLS
+from utils import upload_json_file
+from logs import setup_logging
+
+try:
+	import cv2
+except ImportError:
+	cv2 = None
+
+
+def pil_backend(preprocessing):
+	def run(frames, crop):
+		results = []
+		for frame in frames:
+			image = Image.fromarray(frame)
+			if crop:
+				image = preprocessing.Image_crop(image)
+			results.append(np.asarray(preprocessing.process_image(image)))
+		return np.stack(results)
+	return run
+
+
+def numpy_backend(preprocessing):
+	return preprocessing.process_images
+
+
+def opencv_backend(preprocessing):
+	size = (preprocessing.output_shape[1], preprocessing.output_shape[0])
+	def run(frames, crop):
+		if crop:
+			frames = frames[:, CROP_ROWS, CROP_COLS]
+		# INTER_AREA is the antialiased downscaling of OpenCV
+		return np.stack([cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+						for frame in frames])
+	return run
+
+
+def backends(preprocessing):
+	"""
+		Returns:
+			dict: name -> function(frames, crop) -> preprocessed frames, the reference (PIL) first
+	"""
+	available = {"pil": pil_backend(preprocessing), "numpy": numpy_backend(preprocessing)}
+	if cv2 is not None:
+		available["opencv"] = opencv_backend(preprocessing)
+	return available
+
+
+def sim_like_frames(nb_frames, shape, seed=0):
+	"""
+		Random frames smooth like the simulator ones: pure noise exaggerates the differences of the resamplings
+	"""
+	rng = np.random.default_rng(seed)
+	rows, cols, channels = shape
+	coarse = rng.integers(0, 256, (nb_frames, rows // 10, cols // 10, channels), dtype=np.uint8)
+	frames = np.stack([np.asarray(Image.fromarray(frame).resize((cols, rows), Image.BILINEAR)) for frame in coarse])
+	noise = rng.integers(-10, 11, frames.shape)
+	return np.clip(frames + noise, 0, 255).astype(np.uint8)
+
+
+def measure(run, frames, batch_size, crop, min_frames):
+	"""
+		Preprocesses batches of `batch_size` frames until at least `min_frames` are done
+
+		Returns:
+			dict: frames/s and latencies, and the output of the first batches covering `frames`
+	"""
+	nb_batches = max(1, -(-min_frames // batch_size))
+	latencies = []
+	outputs = []
+	done = 0
+	# Warm-up, not measured
+	run(frames[:batch_size], crop)
+	for i in range(nb_batches):
+		start = (i * batch_size) % len(frames)
+		batch = np.take(frames, range(start, start + batch_size), axis=0, mode="wrap")
+		begin = time.perf_counter()
+		output = run(batch, crop)
+		latencies.append(time.perf_counter() - begin)
+		if done < len(frames):
+			outputs.append(output[:len(frames) - done])
+			done += len(outputs[-1])
+	latencies = np.array(latencies)
+	return {"batches": nb_batches,
+			"frames_per_second": float(nb_batches * batch_size / latencies.sum()),
+			"frame_latency_us": float(latencies.sum() / (nb_batches * batch_size) * 1e6),
+			"batch_latency_ms_p50": float(np.percentile(latencies, 50) * 1000),
+			"batch_latency_ms_p95": float(np.percentile(latencies, 95) * 1000)}, np.concatenate(outputs)
+
+
+def run_benchmark(batch_sizes, nb_frames, min_frames):
+	preprocessing = Preprocessing()
+	frames = sim_like_frames(nb_frames, preprocessing.input_shape)
+	runs = backends(preprocessing)
+	results = []
+	for crop in (False, True):
+		for batch_size in batch_sizes:
+			reference = None
+			for name, run in runs.items():
+				result, output = measure(run, frames, batch_size, crop, min_frames)
+				if reference is None:
+					reference = output
+				result.update({"backend": name,
+								"batch_size": batch_size,
+								"crop": crop,
+								"max_abs_diff": int(np.abs(output.astype(np.int16) - reference).max())})
+				print(f"{name:<8} crop: {crop!s:<5} batch: {batch_size:<5} "
+					f"{result['frames_per_second']:10.1f} frames/s | {result['frame_latency_us']:8.1f} us/frame | "
+					f"max abs diff with pil: {result['max_abs_diff']}")
+				results.append(result)
+	return results
+
+
+def parse_arguments():
+	parser = argparse.ArgumentParser(description='Benchmark of the preprocessing backends')
+	parser.add_argument('--batch_sizes', type=lambda sizes: [int(s) for s in sizes.split(",")],
+						default=[2 ** i for i in range(11)],
+						help='Comma separated batch sizes, defaults to 1,2,4,...,1024')
+	parser.add_argument('--frames', type=int, default=256,
+						help='Number of different frames, the equivalence is checked on all of them')
+	parser.add_argument('--min_frames', type=int, default=1024,
+						help='Minimum number of frames preprocessed for each measure')
+	parser.add_argument('--output', type=str, default=None,
+						help='json file of the results, defaults to local_memory/preprocessing_<date>_benchmark.json')
+	return parser.parse_args()
+
+
+if __name__ == "__main__":
+	args = parse_arguments()
+	setup_logging()
+	results = run_benchmark(args.batch_sizes, args.frames, args.min_frames)
+	file_name = args.output
+	if not file_name:
+		date = datetime.now().strftime("%d_%m_%Hh%Mm")
+		file_name = f"{config.local_memory_folder}/preprocessing_{date}{config.benchmark_sufix}"
+	upload_json_file(file_name, {"date": datetime.now().isoformat(),
+								"machine": {"platform": platform.platform(),
+											"python": sys.version.split()[0],
+											"cpus": os.cpu_count()},
+								"versions": {"numpy": np.__version__,
+											"pillow": Image.__version__,
+											"opencv": cv2.__version__ if cv2 is not None else None},
+								"input_shape": list(Preprocessing().input_shape),
+								"results": results})
+	print(f"Benchmark saved in {file_name}")
@@ -0,0 +1,118 @@
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError
+from config import config
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class SimCrashed(Exception):
+	pass
+
+
+class SimExecutor():
+	"""
+		Single worker executor running the calls of a simulator on one persistent thread.
+		Unlike ThreadPoolExecutor, its thread is daemon: a thread stuck in a hung
+		simulator is abandoned, and is not joined when the process exits.
+	"""
+	def __init__(self, name):
+		self.calls = queue.SimpleQueue()
+		self.thread = threading.Thread(target=self.worker_loop, name=name, daemon=True)
+		self.thread.start()
+
+	def submit(self, function, *args):
+		future = Future()
+		self.calls.put((future, function, args))
+		return future
+
+	def worker_loop(self):
+		while True:
+			call = self.calls.get()
+			if call is None:
+				return
+			future, function, args = call
+			if not future.set_running_or_notify_cancel():
+				continue
+			try:
+				future.set_result(function(*args))
+			except BaseException as e:
+				future.set_exception(e)
+
+	def shutdown(self):
+		# Returns at once: a hung call can not be cancelled
+		self.calls.put(None)
+
+
+class SimSupervisor():
+	def __init__(self, sim, step_timeout=config.sim_step_timeout, max_restarts=config.sim_max_restarts):
+		'''
+			Watches the simulator of `sim` (anything with args and env, built by Simulator):
+			a reset or a step that raises or takes more than `step_timeout` seconds
+			means the simulator is dead or hung, and raises SimCrashed.
+			restart() then gets a new simulator, the rest of the process
+			(replay memory, models, optimizers) is untouched.
+
+			Args:
+				sim: NeuralPlayer, Actor or SimSlot
+				step_timeout (float, optional): 0 disables the timeout. Defaults to config.sim_step_timeout.
+				max_restarts (int, optional): SimCrashed is raised by restart() after this number of restarts.
+					Defaults to config.sim_max_restarts.
+		'''
+		self.sim = sim
+		self.step_timeout = step_timeout
+		self.max_restarts = max_restarts
+		self.restarts = 0
+		self.executor = None
+		if self.step_timeout:
+			self.executor = self.new_executor()
+
+	def new_executor(self):
+		# The calls of the simulator stay on one thread, created once and not by call
+		return SimExecutor(f"sim_{self.sim.args.port}")
+
+	def call(self, function, *args):
+		if not self.executor:
+			try:
+				return function(*args)
+			except Exception as e:
+				raise SimCrashed(f"{function.__name__} raised {e!r}") from e
+		future = self.executor.submit(function, *args)
+		try:
+			return future.result(timeout=self.step_timeout)
+		except TimeoutError:
+			raise SimCrashed(f"{function.__name__} did not return after {self.step_timeout}s") from None
+		except Exception as e:
+			raise SimCrashed(f"{function.__name__} raised {e!r}") from e
+
+	def reset(self):
+		return self.call(self.sim.env.reset)
+
+	def step(self, action):
+		return self.call(self.sim.env.step, action)
+
+	def restart(self, crash):
+		'''
+			Replaces the crashed simulator by a new one:
+			a new sim is requested to simlaunch3000, or args.sim is launched again
+		'''
+		# Imported here as Simulator builds the supervisors
+		from Simulator import start_env
+		if self.restarts >= self.max_restarts:
+			raise crash
+		self.restarts += 1
+		if self.executor:
+			# The thread of the crashed simulator may be stuck in a call
+			self.executor.shutdown()
+			self.executor = self.new_executor()
+		logger.error("Simulator on port %s crashed: %s, restart %s/%s",
+					self.sim.args.port, crash, self.restarts, self.max_restarts)
+		try:
+			self.sim.env.unwrapped.close()
+		except Exception as e:
+			logger.warning("Closing the crashed env raised: %s", e)
+		if self.sim.args.sim == "simlaunch3000":
+			# Also stops its heartbeat
+			self.sim.client.kill_sim()
+		start_env(self.sim)
@@ -6,6 +6,7 @@ net_config.start_port = 9093
 
 net_config.server_port = 9082
 net_config.server_refresh_time = 1 # seconds to wait before listening again
+net_config.ping_timeout = 5 # seconds a heartbeat ping waits for the server
 
 net_config.start_sim_request = "start"
 net_config.ping_request = "ping"
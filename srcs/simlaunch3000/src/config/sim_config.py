@@ -4,4 +4,6 @@ from ..utils import DotDict
 sim_config = DotDict()
 sim_config.max_concurrent_sims = 20 
 sim_config.time_till_timeout = 600
-sim_config.kill_on_timeout = True
\ No newline at end of file
+sim_config.kill_on_timeout = True
+# Seconds between two keep-alive pings of a Client, must stay under time_till_timeout
+sim_config.heartbeat_interval = sim_config.time_till_timeout / 10
\ No newline at end of file
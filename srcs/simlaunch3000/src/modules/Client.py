@@ -1,8 +1,9 @@
-from ..config import net_config
+from ..config import net_config, sim_config
 import socket
 import json
 import os
 import logging
+import threading
 
 HOST = net_config.host  # The server's hostname or IP address
 PORT = net_config.server_port        # The port used by the server
@@ -10,6 +11,10 @@ PORT = net_config.server_port        # The port used by the server
 class  Client():
     def __init__(self):
         self.sim_port = None
+        self.ClientLogger = logging.getLogger("SimClient")
+        self.heartbeat_thread = None
+        self.heartbeat_stop = threading.Event()
+        self.heartbeat_failures = 0
 
     def request_simulator(self):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
@@ -39,8 +44,19 @@ class  Client():
 
 
 
-    def ping_sim(self):
+    def ping_sim(self, timeout=None):
+        '''
+            Tells the server the sim at self.sim_port is still used.
+
+            Args:
+                timeout (float, optional): seconds to wait for the server. Defaults to no timeout.
+
+            Returns:
+                The reply of the server, or None if it could not be reached
+        '''
+        received = None
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
             msg = {"pass": os.environ["PS"], "req": net_config.ping_request, "port" : self.sim_port} # a real dict.
             data = json.dumps(msg)
             try:
@@ -51,13 +67,56 @@ class  Client():
                 received = received.decode("utf-8")
             except:
                 pass
-        try:
-            print('Received', received)
-        except:
-            pass
+        self.ClientLogger.debug(f"Ping of sim {self.sim_port}, received {received}")
+        return received
+
+
+    def start_heartbeat(self, interval = sim_config.heartbeat_interval, on_failure = ()):
+        '''
+            Pings the sim every `interval` seconds from a background thread,
+            so the code driving the sim never waits for the server.
+
+            Args:
+                interval (float, optional): Defaults to sim_config.heartbeat_interval.
+                on_failure (iterable, optional): callbacks called from the heartbeat thread
+                    as callback(client, failures) when a ping gets no reply,
+                    failures being the number of consecutive failed pings.
+        '''
+        self.stop_heartbeat()
+        self.heartbeat_stop.clear()
+        self.heartbeat_failures = 0
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat_loop,
+                                                args=(interval, list(on_failure)),
+                                                daemon=True)
+        self.heartbeat_thread.start()
+
+
+    def heartbeat_loop(self, interval, on_failure):
+        # Event.wait returns True as soon as stop_heartbeat() is called
+        while not self.heartbeat_stop.wait(interval):
+            if self.ping_sim(timeout=net_config.ping_timeout) is not None:
+                self.heartbeat_failures = 0
+                continue
+            self.heartbeat_failures += 1
+            self.ClientLogger.warning(f"Heartbeat of sim {self.sim_port} failed {self.heartbeat_failures} times in a row")
+            for callback in on_failure:
+                try:
+                    callback(self, self.heartbeat_failures)
+                except Exception as e:
+                    self.ClientLogger.error(f"Heartbeat failure callback raised: {e}")
+
+
+    def stop_heartbeat(self):
+        if self.heartbeat_thread is None:
+            return
+        self.heartbeat_stop.set()
+        self.heartbeat_thread.join()
+        self.heartbeat_thread = None
 
 
     def kill_sim(self):
+        # A killed sim must not be kept alive
+        self.stop_heartbeat()
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
             msg = {"pass": os.environ["PS"], "req": net_config.kill_request, "port" : self.sim_port} # a real dict.
             data = json.dumps(msg)
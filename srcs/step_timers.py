@@ -0,0 +1,85 @@
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
+import numpy as np
+from config import config
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+# Shared by every disabled timer: timing a stage then costs a single call
+NO_TIMER = nullcontext()
+
+
+class StageTimer():
+	__slots__ = ("timers", "stage", "start")
+
+	def __init__(self, timers, stage):
+		self.timers = timers
+		self.stage = stage
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+
+	def __exit__(self, *exc):
+		self.timers.add(self.stage, time.perf_counter() - self.start)
+
+
+class StepTimers():
+	def __init__(self, name=None, window=config.timers_window):
+		'''
+			Rolling durations of each stage of a driving loop, dumped as one json line per episode.
+
+			Args:
+				name (str, optional): name of the player, used in the dump file name.
+					Timers are disabled when None.
+				window (int, optional): number of durations kept by stage.
+					Defaults to config.timers_window.
+		'''
+		self.enabled = name is not None
+		self.window = window
+		self.durations = {}
+		self.file_name = None
+		if self.enabled:
+			date = datetime.now().strftime("%d_%m_%Hh%Mm")
+			self.file_name = f"{config.local_memory_folder}/{name}_{date}{config.timers_sufix}"
+
+	def time(self, stage):
+		'''
+			Usage: with timers.time("env.step"): ...
+		'''
+		if not self.enabled:
+			return NO_TIMER
+		return StageTimer(self, stage)
+
+	def add(self, stage, seconds):
+		if stage not in self.durations:
+			self.durations[stage] = deque(maxlen=self.window)
+		self.durations[stage].append(seconds)
+
+	def stats(self):
+		'''
+			Returns:
+				dict: for each stage, its count, mean and p50/p95/p99 in milliseconds
+		'''
+		stats = {}
+		for stage, durations in list(self.durations.items()):
+			ms = np.array(durations) * 1000
+			p50, p95, p99 = np.percentile(ms, (50, 95, 99))
+			stats[stage] = {"count": len(ms),
+							"mean": float(ms.mean()),
+							"p50": float(p50),
+							"p95": float(p95),
+							"p99": float(p99)}
+		return stats
+
+	def dump(self, episode, episode_len):
+		if not self.enabled or not self.durations:
+			return
+		stats = self.stats()
+		with open(self.file_name, "a") as f:
+			f.write(json.dumps({"episode": episode, "episode_len": episode_len, "stages": stats}) + "\n")
+		for stage, s in stats.items():
+			logger.info("%-20s p50: %8.3f ms | p95: %8.3f ms | p99: %8.3f ms", stage, s['p50'], s['p95'], s['p99'])
@@ -0,0 +1,75 @@
+import threading
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class TrainScheduler():
+	def __init__(self, agent, memory, train_every, gradient_steps, background=False):
+		'''
+			Trains `agent` during the episodes: every `train_every` env steps,
+			`gradient_steps` gradient steps are done on `memory`.
+			The update-to-data ratio is gradient_steps / train_every.
+
+			Args:
+				agent: DQNAgent or SoftActorCritic
+				memory (deque): replay memory filled by the driving loop
+				train_every (int): number of env steps between two trainings
+				gradient_steps (int): number of gradient steps of each training
+				background (bool, optional): train on a thread, the driving loop never waits for it.
+					It never lags more than one training behind, older ones are dropped.
+					Defaults to False.
+		'''
+		self.agent = agent
+		self.memory = memory
+		self.train_every = train_every
+		self.gradient_steps = gradient_steps
+		self.background = background
+		self.steps = 0
+		self.updates = 0
+		self.dropped = 0
+		logger.info("Update-to-data ratio: %.3f", gradient_steps / train_every)
+		if background:
+			self.pending = 0
+			self.stopped = False
+			self.condition = threading.Condition()
+			self.thread = threading.Thread(target=self.background_loop, daemon=True)
+			self.thread.start()
+
+	def step(self):
+		'''
+			Must be called after every env step
+		'''
+		self.steps += 1
+		if self.steps % self.train_every:
+			return
+		if not self.background:
+			for _ in range(self.gradient_steps):
+				self.train_step()
+			return
+		with self.condition:
+			total = self.pending + self.gradient_steps
+			self.pending = min(total, self.gradient_steps)
+			self.dropped += total - self.pending
+			self.condition.notify()
+
+	def train_step(self):
+		if self.agent.train_step(self.memory):
+			self.updates += 1
+
+	def background_loop(self):
+		while True:
+			with self.condition:
+				while not self.pending and not self.stopped:
+					self.condition.wait()
+				if self.stopped:
+					return
+				self.pending -= 1
+			self.train_step()
+
+	def close(self):
+		if self.background:
+			with self.condition:
+				self.stopped = True
+				self.condition.notify()
+			self.thread.join()
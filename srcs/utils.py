@@ -51,6 +51,16 @@ def is_cte_out(cte):
 		return False
 
 
+def h5_file_name(file_name):
+	"""
+		Weights are saved and loaded in h5: a name without the .h5 suffix gets it,
+		so that a TF checkpoint with the same name is never loaded instead
+	"""
+	if file_name.endswith(".h5"):
+		return file_name
+	return file_name + ".h5"
+
+
 def upload_pickle_file(file_name, content):
 	with open(file_name, "wb") as f:
 		pickle.dump(content, f)
@@ -97,7 +107,8 @@ def init_dic_info(args, our_s3 = None): ### TODO add infos about last commit ec.
 	else:
 		folder = config.local_memory_folder
 	info_prefix = f"{folder}/{name}_{date}"
-	infos = {"name" : name, "date" : str(date), "env_name" : args.env_name, "prefix" : info_prefix}
+	infos = {"name" : name, "date" : str(date), "env_name" : args.env_name, "prefix" : info_prefix,
+			"frame_skip" : args.frame_skip, "latent" : args.latent}
 	info_file_name = f"{info_prefix}{config.info_sufix}"
 	if args.destination == "s3" and our_s3:
 		our_s3.upload_json_file(info_file_name, infos)
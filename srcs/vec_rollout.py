@@ -0,0 +1,152 @@
+import time
+import copy
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from config import config
+from frame_stack import create_frame_stack
+from agents.factory import sim_actions
+from Simulator import Simulator
+from sim_supervisor import SimCrashed
+from logs import get_logger
+
+logger = get_logger(__name__)
+
+
+class SimSlot():
+	def __init__(self, args, port):
+		'''
+			One of the simulators of a VectorizedRollout, with its own frame stack and episode.
+		'''
+		self.args = copy.copy(args)
+		self.args.port = port
+		# Episodes are not recorded in vectorized mode
+		self.args.save = False
+		self.episode_memory = []
+		Simulator(self)
+		self.frame_stack = create_frame_stack(self.args.latent)
+		self.preprocessed_state = None
+		self.episode_len = 0
+
+	def restart(self, crash, start_episode):
+		'''
+			Replaces the crashed simulator and starts a new episode on it with start_episode(self),
+			until it works or supervisor.restart gives up by raising `crash`.
+			The other simulators are untouched.
+		'''
+		while True:
+			self.supervisor.restart(crash)
+			try:
+				return start_episode(self)
+			except SimCrashed as e:
+				crash = e
+
+
+def sim_step_or_crash(player, action, sim):
+	'''
+		player.sim_step for the pool threads: a crash is returned instead of raised,
+		so that the results of the other simulators are kept
+	'''
+	try:
+		return player.sim_step(action, sim.episode_len, sim)
+	except SimCrashed as crash:
+		return crash
+
+
+class VectorizedRollout():
+	def __init__(self, player, nb_envs, ports=None):
+		'''
+			Drives `nb_envs` simulators at once: each tick, the states of every simulator
+			are stacked in one batch and the agent does a single prediction for all of them.
+
+			Args:
+				player (NeuralPlayer): owns the agent, the preprocessing and the replay memory
+				nb_envs (int): number of simulators
+				ports (list, optional): port of each simulator.
+					Defaults to player.args.port, player.args.port + 1, ...
+					Unused with simlaunch3000, which gives the ports itself.
+		'''
+		self.player = player
+		self.args = player.args
+		self.agent = player.agent
+		if not ports:
+			ports = [self.args.port + i for i in range(nb_envs)]
+		self.sims = []
+		for port in ports:
+			self.sims.append(SimSlot(self.args, port))
+		frame_stack = self.sims[0].frame_stack
+		self.states = np.zeros((nb_envs, *frame_stack.state_shape), dtype=frame_stack.dtype)
+		# env.step is a network round-trip: simulators are waited for in parallel
+		self.pool = ThreadPoolExecutor(max_workers=nb_envs)
+
+	def reset(self, sim):
+		state = sim.supervisor.reset()
+		sim.preprocessed_state = self.player.prepare_state(state, new_episode=True, frame_stack=sim.frame_stack)
+		sim.episode_len = 0
+
+	def start_episode(self, sim):
+		try:
+			self.reset(sim)
+		except SimCrashed as crash:
+			sim.restart(crash, self.reset)
+
+	def end_episode(self, e, sim):
+		# Every episode update the target model to be same with model
+		self.agent.update_target_model()
+		# Save model for each episode
+		if self.agent.train:
+			self.player.checkpoints.maybe_save(e)
+		logger.info("episode: %s port: %s memory length: %s epsilon: %s episode length: %s", e, sim.args.port, len(self.player.memory), self.agent.epsilon, sim.episode_len)
+		self.player.timers.dump(e, sim.episode_len)
+
+	def run(self):
+		try:
+			for sim in self.sims:
+				self.start_episode(sim)
+			e = 0
+			ticks = 0
+			start = time.time()
+			while e < config.EPISODES:
+				for i, sim in enumerate(self.sims):
+					self.states[i] = sim.preprocessed_state[0]
+				with self.player.timers.time("choose_action"):
+					actions = sim_actions(self.args.agent, self.agent, self.states, self.args.throttle)
+				results = self.pool.map(sim_step_or_crash,
+										[self.player] * len(self.sims),
+										actions,
+										self.sims)
+				episode_done = False
+				for sim, action, result in zip(self.sims, actions, results):
+					if isinstance(result, SimCrashed):
+						# Its episode is dropped, the replay memory and the other simulators go on
+						sim.restart(result, self.reset)
+						continue
+					new_state, reward, done, info = result
+					reward = self.player.reward_optimization(reward, done)
+					new_preprocessed_state = self.player.prepare_state(new_state, frame_stack=sim.frame_stack)
+					with self.player.timers.time("save_memory_train"):
+						self.player.save_memory_train(sim.preprocessed_state, action, reward, new_preprocessed_state, done, info)
+					if self.player.scheduler:
+						self.player.scheduler.step()
+					self.agent.update_epsilon()
+					sim.episode_len = sim.episode_len + 1
+					sim.preprocessed_state = new_preprocessed_state
+					if done:
+						self.end_episode(e, sim)
+						self.start_episode(sim)
+						episode_done = True
+						e += 1
+				ticks += 1
+				if episode_done:
+					elapsed = time.time() - start
+					logger.info("ticks/s: %8.2f | env steps/s: %8.2f", ticks / elapsed, ticks * len(self.sims) / elapsed)
+					if self.agent.train and not self.player.scheduler:
+						self.agent.train_on_memory(self.player.memory)
+		finally:
+			self.close()
+
+	def close(self):
+		self.pool.shutdown(wait=False)
+		for sim in self.sims:
+			if sim.args.sim == "simlaunch3000":
+				sim.client.kill_sim()
+			sim.env.unwrapped.close()